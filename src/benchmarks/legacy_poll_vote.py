@@ -0,0 +1,89 @@
+"""Compare the old unwind-first legacy vote path with Database.cast_legacy_vote.
+
+Run from src/ with DATADIR pointing at a config.yml:
+
+    python -m benchmarks.legacy_poll_vote --polls 500 --voters 60 --votes 2000
+
+Everything happens in a scratch database that is dropped afterwards.
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+
+from bson import ObjectId
+
+from database import Database
+from database.db_connection import get_connection
+
+BENCH_DB = "strudel_bench"
+
+
+def unwind_pipeline(poll: ObjectId, user: ObjectId):
+    # what routers.polls.poll_vote used to run before every vote
+    return [
+        {"$unwind": "$voters"},
+        {"$match": {"_id": poll, "voters.user": user}},
+        {"$group": {"_id": "$_id", "original_doc": {"$first": "$$ROOT"}, "user_choice": {"$first": "$voters.choice"}}},
+        {"$addFields": {"original_doc.user_choice": "$user_choice"}},
+        {"$replaceRoot": {"newRoot": "$original_doc"}}
+    ]
+
+
+async def seed(db: Database, poll_count: int, voter_count: int):
+    users = [ObjectId() for _ in range(voter_count)]
+    closes = datetime.now(timezone.utc) + timedelta(days=3)
+    documents = [{
+        "_id": ObjectId(),
+        "title": f"Benchmark poll {i}",
+        "proposal": i,
+        "secret": False,
+        "choices": [{"body": "Yes", "votes": 0}, {"body": "No", "votes": 0}],
+        "voters": [{"user": user, "choice": None} for user in users],
+        "timestamp": datetime.now(timezone.utc),
+        "closes": closes,
+        "can_change_vote": True,
+        "thresholds": [voter_count + 1, voter_count + 1],
+    } for i in range(poll_count)]
+    await db.polls.insert_many(documents)
+    return [document["_id"] for document in documents], users
+
+
+async def old_vote(db: Database, poll: ObjectId, user: ObjectId, choice: str):
+    search = await db.polls.aggregate(unwind_pipeline(poll, user)).to_list()
+    if search[0]["closes"] < datetime.now(timezone.utc):
+        raise Exception
+    await db.polls.update_one({"_id": poll}, {"$set": {"voters.$[elem].choice": choice}},
+                              array_filters=[{"elem.user": user}])
+
+
+async def new_vote(db: Database, poll: ObjectId, user: ObjectId, choice: str):
+    await db.cast_legacy_vote(poll, user, choice)
+
+
+async def run(label: str, vote, db: Database, polls: list, users: list, votes: int):
+    start = time.perf_counter()
+    for i in range(votes):
+        await vote(db, polls[i % len(polls)], users[i % len(users)], "Yes" if i % 3 else "No")
+    elapsed = time.perf_counter() - start
+    print(f"{label:>8}: {elapsed:.2f}s total, {elapsed / votes * 1000:.2f} ms/vote")
+
+
+async def main(args):
+    db = Database(BENCH_DB)
+    await get_connection().drop_database(BENCH_DB)
+    try:
+        polls, users = await seed(db, args.polls, args.voters)
+        print(f"{args.polls} polls x {args.voters} voters, {args.votes} votes")
+        await run("unwind", old_vote, db, polls, users, args.votes)
+        await run("indexed", new_vote, db, polls, users, args.votes)
+    finally:
+        await get_connection().drop_database(BENCH_DB)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--polls", type=int, default=500)
+    parser.add_argument("--voters", type=int, default=60)
+    parser.add_argument("--votes", type=int, default=2000)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,100 @@
+"""Compare FastAPI's response_model path with responses.ModelResponse for a /users/ page.
+
+Run from src/:
+
+    python -m benchmarks.serialization --users 1000 --rounds 200
+
+Nothing touches the database, the users are generated in memory.
+"""
+import argparse
+import json
+import time
+
+from bson import ObjectId
+from pydantic import BaseModel, TypeAdapter, model_validator
+
+import models
+from responses import ModelResponse
+
+
+# what models.DocumentModel looked like before, renaming _id in a before validator
+class LegacyDocumentModel(BaseModel):
+    id: models.PyObjectId
+
+    @model_validator(mode='before')
+    def alias_values(cls, values):
+        values['id'] = values.pop("_id")
+        return values
+
+
+class LegacyUserPartyModel(LegacyDocumentModel):
+    name: str
+    shorthand: str
+    color: str
+
+
+class LegacyUserModel(LegacyDocumentModel):
+    name: str
+    dc_uuid: str
+    mc_uuid: str
+    party: LegacyUserPartyModel | None
+
+
+class LegacyUserCollection(BaseModel):
+    users: list[LegacyUserModel]
+    next_cursor: str | None = None
+
+
+def generate_users(count: int) -> list:
+    parties = [{"_id": ObjectId(), "name": f"Party {i}", "shorthand": f"P{i}", "color": "#336699"} for i in range(8)]
+    return [{
+        "_id": ObjectId(),
+        "name": f"user{i}",
+        "dc_uuid": str(100000000000000000 + i),
+        "mc_uuid": ObjectId().binary.hex(),
+        "party": dict(parties[i % len(parties)]) if i % 5 else None,
+    } for i in range(count)]
+
+
+def response_model_path(users: list, collection) -> bytes:
+    # the handler builds the collection, then fastapi validates it against response_model again, dumps it to
+    # python and lets JSONResponse json.dumps the result
+    content = collection(users=users, next_cursor=None)
+    adapter = TypeAdapter(collection)
+    value = adapter.validate_python(content)
+    return json.dumps(adapter.dump_python(value, mode="json", by_alias=True), ensure_ascii=False,
+                      separators=(",", ":")).encode()
+
+
+def model_response_path(users: list) -> bytes:
+    return ModelResponse({"users": users, "next_cursor": None}, models.UserCollection).body
+
+
+def measure(name: str, rounds: int, users: list, fn):
+    # the legacy validator pops _id, so every round gets fresh dicts
+    batches = [[dict(user, party=dict(user["party"]) if user["party"] else None) for user in users]
+               for _ in range(rounds)]
+    start = time.perf_counter()
+    for batch in batches:
+        fn(batch)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<32}{elapsed / rounds * 1000:8.2f} ms/response")
+    return elapsed
+
+
+def main(args):
+    users = generate_users(args.users)
+    print(f"{args.users} users, {args.rounds} rounds")
+    legacy = measure("response_model, old models", args.rounds, users,
+                     lambda batch: response_model_path(batch, LegacyUserCollection))
+    measure("response_model, new models", args.rounds, users,
+            lambda batch: response_model_path(batch, models.UserCollection))
+    fast = measure("ModelResponse", args.rounds, users, model_response_path)
+    print(f"\nModelResponse is {legacy / fast:.1f}x the old path")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=200)
+    main(parser.parse_args())
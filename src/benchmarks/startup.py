@@ -0,0 +1,60 @@
+"""Measure cold start: how long importing main takes, and how long a fresh uvicorn takes to serve its first request.
+
+Run from src/ with DATADIR pointing at a config.yml (the server half needs the database and discord reachable):
+
+    python -m benchmarks.startup --rounds 5
+
+Set discord.bot_mode to external to time an api worker on its own.
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+IMPORT_MAIN = "import time; start = time.perf_counter(); import main; print(time.perf_counter() - start)"
+
+
+def time_import() -> float:
+    result = subprocess.run([sys.executable, "-c", IMPORT_MAIN], capture_output=True, text=True, check=True)
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def time_first_request(port: int, timeout: float) -> float:
+    start = time.perf_counter()
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(port)],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                # uvicorn only accepts connections once the lifespan has finished starting up
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/openapi.json", timeout=1):
+                    return time.perf_counter() - start
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.02)
+        raise TimeoutError(f"no response within {timeout}s")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def report(name: str, samples: list):
+    print(f"{name:<24}median {statistics.median(samples) * 1000:8.1f} ms   "
+          f"min {min(samples) * 1000:8.1f} ms   max {max(samples) * 1000:8.1f} ms")
+
+
+def main(args):
+    report("import main", [time_import() for _ in range(args.rounds)])
+    if not args.import_only:
+        report("first request served", [time_first_request(args.port, args.timeout) for _ in range(args.rounds)])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--import-only", action="store_true")
+    main(parser.parse_args())
@@ -0,0 +1,27 @@
+"""Run the discord bot and the scheduled jobs in their own process, for discord.bot_mode: external.
+
+Run from src/ with DATADIR pointing at a config.yml:
+
+    python -m bot
+"""
+import asyncio
+
+from bot import bot
+from scheduler import scheduler, load_schedules
+from shared import config, db, invalidation
+
+
+async def main():
+    db.register_member_counts(invalidation)
+    invalidation.start()
+    scheduler.start()
+    await load_schedules()
+    delivery_task = asyncio.create_task(bot.deliver_notifications())
+    try:
+        await bot.client.start(config["discord"]["bot_token"])
+    finally:
+        delivery_task.cancel()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
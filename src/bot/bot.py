@@ -1,7 +1,11 @@
+import asyncio
+
 import discord
 from bson import ObjectId
 from catppuccin import PALETTE
 
+from database.db_connection import secondary_reads
+from database.pipelines import leaderboard_pipeline
 from shared import config, db, webapp_page
 
 intents = discord.Intents.default()
@@ -76,87 +80,8 @@ async def whois(ctx: discord.ApplicationContext, user: discord.Option(discord.Us
 @global_command(
     description="Sends the current party active membership breakdown")  # this decorator makes a slash command
 async def leaderboard(ctx: discord.ApplicationContext):  # a slash command will be created with the name "ping"
-    pipeline = [
-        {
-            '$match': {
-                'inactive': False
-            }
-        }, {
-            '$group': {
-                '_id': '$party',
-                'count': {
-                    '$sum': 1
-                }
-            }
-        }, {
-            '$lookup': {
-                'from': 'parties',
-                'localField': '_id',
-                'foreignField': '_id',
-                'as': 'partyDetails'
-            }
-        }, {
-            '$unwind': {
-                'path': '$partyDetails',
-                'preserveNullAndEmptyArrays': True
-            }
-        }, {
-            '$project': {
-                '_id': 0,
-                'party': {
-                    '$cond': {
-                        'if': {
-                            '$eq': [
-                                '$_id', None
-                            ]
-                        },
-                        'then': 'Independent/Unaffiliated',
-                        'else': '$partyDetails.name'
-                    }
-                },
-                'count': 1
-            }
-        }, {
-            '$group': {
-                '_id': None,
-                'total': {
-                    '$sum': '$count'
-                },
-                'parties': {
-                    '$push': {
-                        'party': '$party',
-                        'count': '$count'
-                    }
-                }
-            }
-        }, {
-            '$unwind': '$parties'
-        }, {
-            '$project': {
-                '_id': 0,
-                'party': '$parties.party',
-                'count': '$parties.count',
-                'percentage': {
-                    '$round': [
-                        {
-                            '$multiply': [
-                                {
-                                    '$divide': [
-                                        '$parties.count', '$total'
-                                    ]
-                                }, 100
-                            ]
-                        }, 2
-                    ]
-                }
-            }
-        }, {
-            '$sort': {
-                'count': -1
-            }
-        }
-    ]
-    db_leaderboard = await db.users.aggregate(pipeline).to_list()
+    pipeline = leaderboard_pipeline()
+    db_leaderboard = await db.users.with_options(read_preference=secondary_reads()).aggregate(pipeline).to_list()
     msg = ""
     for party in db_leaderboard:
         msg += f"{party["party"]} - {party["percentage"]:.2f}% ({str(party["count"])})\n"
@@ -167,3 +92,30 @@ async def leaderboard(ctx: discord.ApplicationContext):  # a slash command will
 async def notify(message: str):
     channel = await client.fetch_channel(config["discord"]["notifications_channel"])
     await channel.send(message)
+
+
+async def deliver_notifications():
+    """Send queued notifications (shared.notify) to the notifications channel, runs until cancelled."""
+    interval = config["discord"].get("notification_poll_interval", 2)
+    await client.wait_until_ready()
+    while True:
+        notification = None
+        sent = False
+        try:
+            notification = await db.claim_notification()
+            if notification is None:
+                await asyncio.sleep(interval)
+                continue
+            await notify(notification["message"])
+            sent = True
+            await db.complete_notification(notification)
+        except Exception as e:
+            # nothing supervises this task, so whatever went wrong it has to keep going
+            print(f"notification delivery failed: {e}")
+            if notification is not None and not sent:
+                try:
+                    await db.release_notification(notification)
+                except Exception:
+                    # its lease hands it back once it runs out
+                    pass
+            await asyncio.sleep(interval)
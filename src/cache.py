@@ -0,0 +1,69 @@
+import asyncio
+import time
+
+MISSING = object()
+
+
+class TTLCache:
+    """A small in-process cache whose entries expire ttl seconds after they're set."""
+
+    def __init__(self, ttl: float, maxsize: int = 1024):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries = {}
+
+    def get(self, key, default=MISSING):
+        entry = self._entries.get(key)
+        if entry is None:
+            return default
+        expires, value = entry
+        if expires < time.monotonic():
+            self._entries.pop(key, None)
+            return default
+        return value
+
+    def set(self, key, value):
+        self._entries.pop(key, None)
+        if len(self._entries) >= self.maxsize:
+            # dicts keep insertion order, so this drops the oldest entry
+            self._entries.pop(next(iter(self._entries)))
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+
+    def invalidate(self, key):
+        self._entries.pop(key, None)
+
+    def invalidate_where(self, predicate):
+        for key in [key for key, (_, value) in self._entries.items() if predicate(value)]:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+
+class Snapshot:
+    """A value built from a whole (small) collection, reloaded ttl seconds after loading or once invalidated."""
+
+    def __init__(self, loader, ttl: float):
+        self.loader = loader
+        self.ttl = ttl
+        self._value = MISSING
+        self._expires = 0.0
+        self._generation = 0
+        self._lock = asyncio.Lock()
+
+    async def get(self):
+        if self._value is MISSING or self._expires < time.monotonic():
+            async with self._lock:
+                if self._value is MISSING or self._expires < time.monotonic():
+                    generation = self._generation
+                    self._value = await self.loader()
+                    if generation == self._generation:
+                        self._expires = time.monotonic() + self.ttl
+                    else:
+                        # invalidated while loading, reload on the next read
+                        self._expires = 0.0
+        return self._value
+
+    def invalidate(self):
+        self._generation += 1
+        self._expires = 0.0
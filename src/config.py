@@ -0,0 +1,11 @@
+import os
+
+import yaml
+
+
+def get_config() -> dict:
+    """config.yml from $DATADIR, read on first use and shared by everything after."""
+    if not hasattr(get_config, "config"):
+        with open(os.path.join(os.environ["DATADIR"], "config.yml"), 'r') as file:
+            get_config.config = yaml.safe_load(file)
+    return get_config.config
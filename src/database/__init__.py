@@ -1,290 +1,492 @@
+import asyncio
+from collections import Counter
+from datetime import datetime, timezone, timedelta
 from typing import List
 
-from database.db_connection import get_connection
+from cache import TTLCache, Snapshot, MISSING
+from config import get_config
+from database.db_connection import get_connection, LazyCollection, secondary_reads
 from bson import ObjectId
 from bson.codec_options import CodecOptions
-from pymongo import ReturnDocument
+from pymongo import ReturnDocument, ASCENDING, DESCENDING, UpdateOne
+from pymongo.errors import PyMongoError, BulkWriteError
 
+from database import slow_ops
+from database.indexes import ensure_indexes
+from database.pagination import SortOption, ALPHABETICAL, page
+from database.pipelines import legacy_polls_pipeline, voter_status_pipeline, legacy_votes_by_user_pipeline, \
+    poll_votes_by_user_pipeline, election_votes_by_user_pipeline, proposals_by_author_pipeline, party_members_pipeline, \
+    legacy_poll_choices_pipeline, poll_choices_pipeline
+from database.sequences import SequenceAllocator
 from models import VoterStatusModel, ElectionBallot
 
 options = CodecOptions(tz_aware=True)
 
 
+USER_SORTS = {
+    "alphabetical": SortOption("name", 1, ALPHABETICAL),
+    "activity": SortOption("activity_score", -1),
+    "server_seniority": SortOption("_id", 1),
+}
+
+# all that list views of proposals (ProposalReferenceModel) need, revisions can be large
+PROPOSAL_REFERENCE_FIELDS = {"title": 1, "author": 1, "invalid": 1}
+
+# a unique index rejected the write
+DUPLICATE_KEY = 11000
+
+# activity score points
+VOTE_ACTIVITY = 1
+PROPOSAL_ACTIVITY = 5
+
+PARTY_SORTS = {
+    "alphabetical": SortOption("name", 1, ALPHABETICAL),
+    "members": SortOption("stats.members", -1),
+    "registered_members": SortOption("stats.registered_members", -1),
+    "seniority": SortOption("_id", 1),
+    "unity_score": SortOption("stats.unity_score", -1),
+}
+
+PROPOSAL_SORTS = {
+    "oldest": SortOption("_id", 1),
+    "newest": SortOption("_id", -1),
+}
+
+
 class InvalidBallotException(Exception):
     pass
 
 
+class VoteNotAllowedException(Exception):
+    pass
+
+
 class Database:
-    def __init__(self):
-        self._client = get_connection()
-        self._db = self._client.get_database("strudel")
-        self.users = self._db.get_collection("users")
-        self.parties = self._db.get_collection("parties")
-        self.elections = self._db.get_collection("elections")
-        self.proposals = self._db.get_collection("proposals")
-        self.polls = self._db.get_collection("polls", options)
-        self.counters = self._db.get_collection("counters")
+    def __init__(self, name: str = "strudel"):
+        self.name = name
+        self.users = LazyCollection(name, "users")
+        self.parties = LazyCollection(name, "parties")
+        self.elections = LazyCollection(name, "elections")
+        self.proposals = LazyCollection(name, "proposals")
+        self.proposal_revisions = LazyCollection(name, "proposal_revisions")
+        self.polls = LazyCollection(name, "polls", options)
+        self.counters = LazyCollection(name, "counters")
+        self.polls_v2 = LazyCollection(name, "polls_v2")
+        self.polls_voters = LazyCollection(name, "polls_voters")
+        self.polls_ballots = LazyCollection(name, "polls_ballots")
+        self.roles = LazyCollection(name, "roles")
+        self.slow_ops = LazyCollection(name, "slow_ops")
+        self.notifications = LazyCollection(name, "notifications")
+        self._sequences = {}
+        self._members_dirty = False
+        self._members_task = None
+        cache_config = get_config().get("cache", {})
+        self.role_permissions = Snapshot(self._load_role_permissions, cache_config.get("permissions_ttl", 60))
+        self._user_roles = TTLCache(cache_config.get("permissions_ttl", 60))
+        # parties are few and rarely change, users and proposals get theirs joined in from this table
+        self.party_table = Snapshot(self._load_party_table, cache_config.get("parties_ttl", 300))
+
+    @property
+    def _db(self):
+        # the client is only created once something actually talks to the database
+        return get_connection().get_database(self.name)
+
+    async def ensure_indexes(self):
+        await ensure_indexes(self._db)
+
+    async def start_slow_op_log(self):
+        slow_op_config = get_config().get("slow_ops", {})
+        await slow_ops.ensure_collection(self._db, slow_op_config.get("size", 16 * 1024 * 1024))
+        slow_ops.listener.start(self._db, slow_op_config.get("threshold_ms", 100),
+                                slow_op_config.get("explain_interval", 60))
+
+    async def get_slow_ops(self, limit: int, route: str = None) -> list:
+        query = {} if route is None else {"route": route}
+        # capped collections keep insertion order, newest first without an index
+        return await self.slow_ops.find(query).sort("$natural", DESCENDING).limit(limit).to_list(None)
+
+    async def record_activity(self, user: ObjectId, points: int):
+        await self.users.update_one({"_id": user}, {"$inc": {"activity_score": points}})
+
+    async def rebuild_activity_scores(self, batch_size: int = 500):
+        """Recompute every user's activity score from scratch, correcting any drift in the incremental updates."""
+        scores = {}
+
+        async def tally(collection, pipeline, points):
+            async for row in collection.aggregate(pipeline):
+                scores[row["_id"]] = scores.get(row["_id"], 0) + row["count"] * points
+
+        # migrated legacy polls live in both poll systems, only count them once
+        migrated = await self.polls_v2.distinct("_id", {"legacy": {"$exists": True}})
+        await tally(self.polls, legacy_votes_by_user_pipeline(migrated), VOTE_ACTIVITY)
+        await tally(self.polls_voters, poll_votes_by_user_pipeline(), VOTE_ACTIVITY)
+        await tally(self.elections, election_votes_by_user_pipeline(), VOTE_ACTIVITY)
+        await tally(self.proposals, proposals_by_author_pipeline(), PROPOSAL_ACTIVITY)
+
+        updates = []
+        async for user in self.users.find({}, {"_id": 1}):
+            updates.append(UpdateOne({"_id": user["_id"]}, {"$set": {"activity_score": scores.get(user["_id"], 0)}}))
+            if len(updates) >= batch_size:
+                await self.users.bulk_write(updates, ordered=False)
+                updates = []
+        if updates:
+            await self.users.bulk_write(updates, ordered=False)
+
+    async def refresh_party_members(self, parties: List[ObjectId] | None = None):
+        """Recount members and registered (active) members, for every party or just the given ones."""
+        user_query = {"party": {"$ne": None}}
+        party_query = {}
+        if parties is not None:
+            user_query = {"party": {"$in": parties}}
+            party_query = {"_id": {"$in": parties}}
+        counts = {row["_id"]: row async for row in self.users.aggregate(party_members_pipeline(user_query))}
+        updates = [UpdateOne({"_id": party["_id"]}, {"$set": {
+            "stats.members": counts.get(party["_id"], {}).get("members", 0),
+            "stats.registered_members": counts.get(party["_id"], {}).get("registered_members", 0),
+        }}) async for party in self.parties.find(party_query, {"_id": 1})]
+        if updates:
+            await self.parties.bulk_write(updates, ordered=False)
+        self.forget_parties()
+
+    async def refresh_party_unity(self, rebuild: bool = False):
+        """Fold closed polls that haven't been counted yet into each party's unity score.
+
+        A party's unity score is the share of pairs of its members, across every closed non-secret poll they
+        both voted in, that picked the same choice. Members are grouped by their current party.
+        """
+        now = datetime.now(timezone.utc)
+        if rebuild is True:
+            await self.polls.update_many({}, {"$unset": {"unity_counted": ""}})
+            await self.polls_v2.update_many({}, {"$unset": {"unity_counted": ""}})
+            await self.parties.update_many({}, {"$set": {"stats.unity_agreeing_pairs": 0, "stats.unity_pairs": 0}})
+        user_parties = {user["_id"]: user["party"]
+                        async for user in self.users.find({"party": {"$ne": None}}, {"party": 1})}
+
+        # claim the polls before tallying them, so runs overlapping from other workers or close_poll never count
+        # a poll twice. A run dying after its claim leaves those polls uncounted until a rebuild
+        token = ObjectId()
+        legacy_query = {"closes": {"$lte": now}, "secret": False, "unity_counted": {"$exists": False}}
+        await self.polls.update_many(legacy_query, {"$set": {"unity_counted": token}})
+        legacy_polls = await self.polls.distinct("_id", {"unity_counted": token})
+        # migrated legacy polls are copied into polls_v2 with the same voters, they're counted from polls
+        v2_query = {"open": False, "secret": False, "ballot_type": "choose-one", "legacy": {"$exists": False},
+                    "unity_counted": {"$exists": False}}
+        await self.polls_v2.update_many(v2_query, {"$set": {"unity_counted": token}})
+        v2_polls = await self.polls_v2.distinct("_id", {"unity_counted": token})
+
+        # every (poll, choice) a voter picked, from both poll systems
+        choices = []
+        async for row in self.polls.aggregate(legacy_poll_choices_pipeline(legacy_polls)):
+            choices.append(row)
+        async for row in self.polls_voters.aggregate(poll_choices_pipeline(v2_polls)):
+            choices.append(row)
+
+        tallies = {}
+        for row in choices:
+            party = user_parties.get(row["user"])
+            if party is not None:
+                tallies.setdefault((row["poll"], party), Counter())[row["choice"]] += 1
+        totals = {}
+        for (_, party), tally in tallies.items():
+            voted = sum(tally.values())
+            agreeing, pairs = totals.get(party, (0, 0))
+            totals[party] = (agreeing + sum(n * (n - 1) // 2 for n in tally.values()),
+                             pairs + voted * (voted - 1) // 2)
+
+        updates = [UpdateOne({"_id": party}, {"$inc": {"stats.unity_agreeing_pairs": agreeing, "stats.unity_pairs": pairs}})
+                   for party, (agreeing, pairs) in totals.items()]
+        if updates:
+            await self.parties.bulk_write(updates, ordered=False)
+        await self.parties.update_many({}, [{"$set": {"stats.unity_score": {"$cond": [
+            {"$gt": [{"$ifNull": ["$stats.unity_pairs", 0]}, 0]},
+            {"$divide": ["$stats.unity_agreeing_pairs", "$stats.unity_pairs"]},
+            0
+        ]}}}])
+        self.forget_parties()
 
     async def get_next_sequence_value(self, sequence_name):
-        """Get the next sequence value for a given sequence name."""
-        result = await self.counters.find_one_and_update(
-            {'_id': sequence_name},
-            {'$inc': {'sequence_value': 1}},
-            return_document=ReturnDocument.AFTER,
-            upsert=True
-        )
-        return result['sequence_value']
+        """Get the next sequence value for a given sequence name.
+
+        Sequences are strict unless config.yml gives them a block size under sequences, proposal numbers
+        should stay strict so they're handed out without gaps.
+        """
+        if sequence_name not in self._sequences:
+            block = get_config().get("sequences", {}).get(sequence_name, 1)
+            self._sequences[sequence_name] = SequenceAllocator(self.counters, sequence_name, block)
+        return await self._sequences[sequence_name].next()
+
+    async def _load_party_table(self) -> dict:
+        return {party["_id"]: party async for party in self.parties.find({})}
+
+    @staticmethod
+    def _with_party(user: dict, party_table: dict) -> dict:
+        party = party_table.get(user.get("party"))
+        user["party"] = dict(party) if party is not None else None
+        return user
+
+    async def _with_leaders(self, parties: list) -> list:
+        leader_ids = [party["leader"] for party in parties if party.get("leader") is not None]
+        leaders = {}
+        if leader_ids:
+            leaders = {user["_id"]: user async for user in self.users.find({"_id": {"$in": leader_ids}})}
+        for party in parties:
+            party["leader"] = leaders.get(party.get("leader"))
+        return parties
+
+    async def _with_authors(self, proposals: list) -> list:
+        author_ids = list({proposal["author"] for proposal in proposals})
+        authors = {}
+        if author_ids:
+            authors = {user["_id"]: user for user in await self.query_users({"_id": {"$in": author_ids}})}
+        for proposal in proposals:
+            proposal["author"] = authors.get(proposal["author"])
+        return proposals
+
+    def forget_parties(self):
+        """Drop the cached party table, call this whenever a party changes."""
+        self.party_table.invalidate()
 
     async def query_parties(self, query: dict) -> list:
-        pipeline = [
-            {
-                '$match': query
-            }, {
-                '$lookup': {
-                    'from': 'users',
-                    'localField': 'leader',
-                    'foreignField': '_id',
-                    'as': 'leader'
-                }
-            }, {
-                '$unwind': {
-                    'path': '$leader',
-                    'preserveNullAndEmptyArrays': True
-                }
-            }, {
-                '$addFields': {
-                    'leader': {
-                        '$ifNull': [
-                            '$leader', None
-                        ]
-                    }
-                }
-            }
-        ]
-        result = await self.parties.aggregate(pipeline).to_list()
-        return result
+        return await self._with_leaders(await self.parties.find(query).to_list())
 
     async def query_users(self, query: dict) -> list:
-        pipeline = [
-            {"$match": query},
-            {
-                "$lookup": {
-                    "from": "parties",
-                    "localField": "party",
-                    "foreignField": "_id",
-                    "as": "party"
-                }
-            },
-            {"$unwind": {"path": "$party", "preserveNullAndEmptyArrays": True}},
-            {
-                "$addFields": {
-                    "party": {"$ifNull": ["$party", None]}
-                }
-            }
-        ]
-        result = await self.users.aggregate(pipeline).to_list()
-        return result
+        party_table = await self.party_table.get()
+        return [self._with_party(user, party_table) for user in await self.users.find(query).to_list()]
 
     async def query_proposals(self, query: dict) -> list:
-        pipeline = [
-            {"$match": query},
-            {
-                "$lookup": {
-                    "from": "users",
-                    "localField": "author",
-                    "foreignField": "_id",
-                    "as": "author"
-                }
-            },
-            {"$unwind": {"path": "$author", "preserveNullAndEmptyArrays": True}},
-            {
-                "$lookup": {
-                    "from": "parties",
-                    "localField": "author.party",
-                    "foreignField": "_id",
-                    "as": "author.party"
-                }
-            },
-            {"$unwind": {"path": "$author.party", "preserveNullAndEmptyArrays": True}},
-            {
-                "$addFields": {
-                    "author.party": {"$ifNull": ["$author.party", None]}
-                }
+        return await self._with_authors(await self.proposals.find(query, PROPOSAL_REFERENCE_FIELDS).to_list())
+
+    @staticmethod
+    def _list_reads(collection, secondary: bool):
+        # only a list route's own query may go to a secondary, cache loaders and auth lookups stay on the primary
+        return collection.with_options(read_preference=secondary_reads()) if secondary else collection
+
+    async def page_parties(self, query: dict, sort: str, limit: int, cursor: str | None = None,
+                           secondary: bool = False):
+        parties, next_cursor = await page(self._list_reads(self.parties, secondary), query, PARTY_SORTS[sort], limit,
+                                          cursor)
+        return await self._with_leaders(parties), next_cursor
+
+    async def page_users(self, query: dict, sort: str, limit: int, cursor: str | None = None,
+                         secondary: bool = False):
+        users, next_cursor = await page(self._list_reads(self.users, secondary), query, USER_SORTS[sort], limit,
+                                        cursor)
+        party_table = await self.party_table.get()
+        return [self._with_party(user, party_table) for user in users], next_cursor
+
+    async def page_proposals(self, query: dict, sort: str, limit: int, cursor: str | None = None):
+        proposals, next_cursor = await page(self.proposals, query, PROPOSAL_SORTS[sort], limit, cursor,
+                                            PROPOSAL_REFERENCE_FIELDS)
+        return await self._with_authors(proposals), next_cursor
+
+    async def query_polls(self, query: dict, respect_secrets: bool = True, include_voters: bool = True,
+                          secondary: bool = False) -> list:
+        result = await self._list_reads(self.polls, secondary).aggregate(
+            legacy_polls_pipeline(query, include_voters)).to_list()
+        # choice vote counts are kept on the poll document by the vote path, see ensure_poll_counters
+        hydrate = []
+        for poll in result:
+            hidden = respect_secrets is True and poll["secret"] is True
+            if hidden and poll["can_change_vote"] is True:
+                for choice in poll["choices"]:
+                    choice["votes"] = 0
+            if include_voters is True:
+                if hidden:
+                    poll["voters"] = []
+                else:
+                    hydrate.append(poll)
+        if hydrate:
+            user_ids = list({voter["user"] for poll in hydrate for voter in poll["voters"]})
+            users = {user["_id"]: user for user in await self.query_users({"_id": {"$in": user_ids}})}
+            for poll in hydrate:
+                poll["voters"] = [{"user": users[voter["user"]], "choice": voter["choice"]}
+                                  for voter in poll["voters"] if voter["user"] in users]
+        return result
+
+    async def cast_legacy_vote(self, poll: ObjectId, user: ObjectId, choice: str) -> dict | None:
+        """Record a user's choice on a legacy poll.
+
+        The closing time, can_change_vote and choice validity are all checked by the filter of a single
+        update, so a vote can't land on a poll that closed or locked between the read and the write.
+        Returns the poll if this vote decided it, see settle_legacy_poll.
+        """
+        while True:
+            search = await self.polls.find_one({"_id": poll, "voters.user": user}, {"voters.$": 1})
+            if search is None:
+                raise KeyError
+            previous = search["voters"][0]["choice"]
+            query = {
+                "_id": poll,
+                "closes": {"$gt": datetime.now(timezone.utc)},
+                "choices.body": choice,
+                "voters": {"$elemMatch": {"user": user, "choice": previous}},
             }
-        ]
-        result = await self.proposals.aggregate(pipeline).to_list()
+            if previous is not None:
+                query["can_change_vote"] = True
+            update = {"$set": {"voters.$[voter].choice": choice}}
+            array_filters = [{"voter.user": user}]
+            if previous != choice:
+                update["$inc"] = {"choices.$[new].votes": 1}
+                array_filters.append({"new.body": choice})
+                if previous is not None:
+                    update["$inc"]["choices.$[old].votes"] = -1
+                    array_filters.append({"old.body": previous})
+            result = await self.polls.update_one(query, update, array_filters=array_filters)
+            if result.matched_count == 1:
+                if previous is None:
+                    await self.record_activity(user, VOTE_ACTIVITY)
+                return await self.settle_legacy_poll(poll)
+            # work out which rule rejected the vote
+            search = await self.polls.find_one({"_id": poll, "voters.user": user},
+                                               {"closes": 1, "can_change_vote": 1, "choices": 1, "voters.$": 1})
+            if search is None:
+                raise KeyError
+            if search["closes"] <= datetime.now(timezone.utc):
+                raise VoteNotAllowedException("Poll is closed")
+            if choice not in [c["body"] for c in search["choices"]]:
+                raise InvalidBallotException(f"Invalid choice: {choice}")
+            if search["voters"][0]["choice"] != previous:
+                # the same user voted concurrently, try again against their new choice
+                continue
+            raise VoteNotAllowedException("Vote can no longer be changed")
+
+    async def settle_legacy_poll(self, poll: ObjectId) -> dict | None:
+        """Lock a legacy poll once its vote counters reach a threshold.
+
+        Only the update that flips can_change_vote gets the poll back (with an "outcome" of PASSED or
+        FAILED), so whoever announces the result does it exactly once.
+        """
+        def reached(index: int):
+            return {"$gte": [{"$arrayElemAt": ["$choices.votes", index]}, {"$arrayElemAt": ["$thresholds", index]}]}
+
+        # secret polls only settle once everyone has voted
+        everyone_voted = {"$or": [
+            {"$ne": ["$secret", True]},
+            {"$eq": [{"$sum": "$choices.votes"}, {"$size": "$voters"}]}
+        ]}
+        result = await self.polls.find_one_and_update(
+            {"_id": poll, "can_change_vote": True, "$expr": {"$and": [everyone_voted, {"$or": [reached(0), reached(1)]}]}},
+            {"$set": {"can_change_vote": False}},
+            projection={"title": 1, "choices": 1, "thresholds": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        if result is None:
+            return None
+        if result["choices"][1]["votes"] >= result["thresholds"][1]:
+            result["outcome"] = "FAILED"
+        else:
+            result["outcome"] = "PASSED"
         return result
 
-    async def query_polls(self, query: dict, respect_secrets: bool = True) -> list:
-        pipeline = [
-            {"$match": query},
-            {
-                '$unwind': '$voters'
-            }, {
-                '$lookup': {
-                    'from': 'users',
-                    'localField': 'voters.user',
-                    'foreignField': '_id',
-                    'as': 'voter_user'
-                }
-            }, {
-                '$unwind': '$voter_user'
-            }, {
-                '$lookup': {
-                    'from': 'parties',
-                    'localField': 'voter_user.party',
-                    'foreignField': '_id',
-                    'as': 'voter_user_party'
-                }
-            }, {
-                '$unwind': {
-                    'path': '$voter_user_party',
-                    'preserveNullAndEmptyArrays': True
-                }
-            }, {
-                '$addFields': {
-                    'voter_user.party': {
-                        '$cond': {
-                            'if': {
-                                '$eq': [
-                                    '$voter_user.party', None
-                                ]
-                            },
-                            'then': None,
-                            'else': '$voter_user_party'
-                        }
-                    }
-                }
-            }, {
-                '$group': {
-                    '_id': '$_id',
-                    'originalFields': {
-                        '$first': '$$ROOT'
-                    },
-                    'voters': {
-                        '$push': {
-                            'user': '$voter_user',
-                            'choice': '$voters.choice'
-                        }
-                    }
-                }
-            }, {
-                '$replaceRoot': {
-                    'newRoot': {
-                        '$mergeObjects': [
-                            '$originalFields', {
-                                'voters': '$voters'
-                            }
-                        ]
-                    }
-                }
-            }, {
-                '$unwind': '$choices'
-            }, {
-                '$lookup': {
-                    'from': 'polls',
-                    'localField': 'choices.body',
-                    'foreignField': 'voters.choice',
-                    'as': 'votes'
-                }
-            }, {
-                '$addFields': {
-                    'choices.votes': {
-                        '$size': {
-                            '$filter': {
-                                'input': '$voters',
-                                'as': 'voter',
-                                'cond': {
-                                    '$eq': [
-                                        '$$voter.choice', '$choices.body'
-                                    ]
+    async def ensure_poll_counters(self):
+        """Backfill per-choice vote counters on legacy polls created before votes maintained them."""
+        await self.polls.update_many({"choices.votes": {"$exists": False}}, [{
+            "$set": {
+                "choices": {
+                    "$map": {
+                        "input": "$choices",
+                        "as": "choice",
+                        "in": {
+                            "$mergeObjects": [
+                                "$$choice", {
+                                    "votes": {
+                                        "$size": {
+                                            "$filter": {
+                                                "input": "$voters",
+                                                "as": "voter",
+                                                "cond": {"$eq": ["$$voter.choice", "$$choice.body"]}
+                                            }
+                                        }
+                                    }
                                 }
-                            }
+                            ]
                         }
                     }
                 }
-            }, {
-                '$group': {
-                    '_id': '$_id',
-                    'originalFields': {
-                        '$first': '$$ROOT'
-                    },
-                    'choices': {
-                        '$push': '$choices'
-                    }
-                }
-            }, {
-                '$replaceRoot': {
-                    'newRoot': {
-                        '$mergeObjects': [
-                            '$originalFields', {
-                                'choices': '$choices'
-                            }
-                        ]
-                    }
-                }
-            }, {
-                '$addFields': {
-                    'total_voters': {
-                        '$size': '$voters'
-                    }
-                }
-            },
-            {"$sort": {"_id": 1}}
-        ]
-        result = await self.polls.aggregate(pipeline).to_list()
-        if respect_secrets is True:
-            for poll in result:
-                if poll["secret"] is True:
-                    poll["voters"] = []
-                    if poll["can_change_vote"] is True:
-                        for choice in poll["choices"]:
-                            choice["votes"] = 0
-        return result
+            }
+        }])
+
+    async def _load_role_permissions(self) -> dict:
+        return {role["_id"]: set(role.get("permissions", [])) async for role in self.roles.find({}, {"permissions": 1})}
+
+    async def get_user_permissions(self, user: ObjectId) -> set:
+        roles = self._user_roles.get(user)
+        if roles is MISSING:
+            search = await self.users.find_one({"_id": user}, {"roles": 1})
+            roles = search.get("roles", []) if search is not None else []
+            self._user_roles.set(user, roles)
+        role_permissions = await self.role_permissions.get()
+        return set().union(*(role_permissions.get(role, set()) for role in roles))
 
     async def user_has_permission(self, user: ObjectId, permission: str) -> bool:
-        pipeline = [
-            {
-                '$match': {
-                    '_id': user
-                }
-            }, {
-                '$lookup': {
-                    'from': 'roles',
-                    'localField': 'roles',
-                    'foreignField': '_id',
-                    'as': 'roleDetails'
-                }
-            }, {
-                '$addFields': {
-                    'allPermissions': {
-                        '$reduce': {
-                            'input': '$roleDetails.permissions',
-                            'initialValue': [],
-                            'in': {
-                                '$setUnion': [
-                                    '$$value', '$$this'
-                                ]
-                            }
-                        }
-                    }
-                }
-            }, {
-                '$match': {
-                    'allPermissions': permission
-                }
-            }, {
-                '$project': {
-                    '_id': 1,
-                    'roles': 1
-                }
-            }
-        ]
-        result = await self.users.aggregate(pipeline).to_list(length=1)
-        if result:
-            return True
+        return permission in await self.get_user_permissions(user)
+
+    def forget_user_roles(self, user: ObjectId):
+        """Drop a user's cached roles, call this whenever a user's roles change."""
+        self._user_roles.invalidate(user)
+
+    async def enqueue_notification(self, message: str):
+        await self.notifications.insert_one({"message": message, "state": "pending", "attempts": 0,
+                                             "created": datetime.now(timezone.utc)})
+
+    async def claim_notification(self, lease: float = 60) -> dict | None:
+        """Take the oldest undelivered notification. One whose sender died mid-send comes back after the lease."""
+        now = datetime.now(timezone.utc)
+        return await self.notifications.find_one_and_update(
+            {"$or": [{"state": "pending"},
+                     {"state": "sending", "claimed": {"$lt": now - timedelta(seconds=lease)}}]},
+            {"$set": {"state": "sending", "claimed": now}, "$inc": {"attempts": 1}},
+            sort=[("_id", ASCENDING)], return_document=ReturnDocument.AFTER)
+
+    async def complete_notification(self, notification: dict):
+        await self.notifications.update_one({"_id": notification["_id"]},
+                                            {"$set": {"state": "sent", "sent": datetime.now(timezone.utc)}})
+
+    async def release_notification(self, notification: dict, max_attempts: int = 5):
+        state = "failed" if notification["attempts"] >= max_attempts else "pending"
+        await self.notifications.update_one({"_id": notification["_id"]}, {"$set": {"state": state}})
+
+    def register_invalidation(self, bus):
+        bus.register(self.users, self._user_changed)
+        bus.register(self.parties, lambda change: self.forget_parties())
+        bus.register(self.roles, lambda change: self.role_permissions.invalidate())
+
+    def register_member_counts(self, bus):
+        """Recount party members when users join, leave or go inactive.
+
+        Every party is recounted, so only the process running the scheduled jobs registers this, not every worker.
+        """
+        bus.register(self.users, self._user_membership_changed)
+
+    def _user_changed(self, change):
+        if change is None:
+            self._user_roles.clear()
         else:
-            return False
+            self.forget_user_roles(change["documentKey"]["_id"])
+
+    def _user_membership_changed(self, change):
+        if change is None or change["operationType"] != "update":
+            self._party_members_changed()
+            return
+        description = change["updateDescription"]
+        changed = set(description.get("updatedFields", {})) | set(description.get("removedFields", []))
+        if {"party", "inactive"} & changed:
+            self._party_members_changed()
+
+    def _party_members_changed(self):
+        self._members_dirty = True
+        if self._members_task is None or self._members_task.done():
+            self._members_task = asyncio.get_running_loop().create_task(self._refresh_changed_members())
+
+    async def _refresh_changed_members(self):
+        # the old party isn't in the change event, so recount every party; a burst of changes only recounts once
+        while self._members_dirty:
+            await asyncio.sleep(1)
+            self._members_dirty = False
+            try:
+                await self.refresh_party_members()
+            except PyMongoError as e:
+                print(f"could not refresh party members: {e}")
 
     async def get_poll(self, query: dict, respect_secrets: bool = True) -> dict:
         search = await self.query_polls(query, respect_secrets=respect_secrets)
@@ -293,22 +495,81 @@ class Database:
         return search[0]
 
     async def get_proposal(self, query: dict) -> dict:
-        search = await self.query_proposals(query)
-        if len(search) == 0:
+        """Get a proposal with its latest revision, older ones are fetched with get_proposal_revisions."""
+        search = await self.proposals.find_one(query)
+        if search is None:
             raise KeyError
-        return search[0]
+        latest = search.pop("latest_revision", None)
+        search["revisions"] = [latest] if latest is not None else []
+        return (await self._with_authors([search]))[0]
+
+    async def search_proposals(self, text: str, limit: int, offset: int = 0) -> list:
+        """Full-text search over proposal titles and latest revisions, best matches first."""
+        score = {"score": {"$meta": "textScore"}}
+        search = self.proposals.find({"$text": {"$search": text}}, PROPOSAL_REFERENCE_FIELDS | score)
+        proposals = await search.sort([("score", {"$meta": "textScore"}), ("_id", ASCENDING)]) \
+            .skip(offset).limit(limit).to_list()
+        return await self._with_authors(proposals)
+
+    async def get_proposal_revisions(self, proposal: int, before: int | None = None, limit: int = 20) -> list:
+        """Get a proposal's revisions newest first, starting below the before sequence number if given."""
+        query = {"proposal": proposal}
+        if before is not None:
+            query["seq"] = {"$lt": before}
+        return await self.proposal_revisions.find(query).sort("seq", DESCENDING).limit(limit).to_list()
+
+    async def get_proposal_revision(self, proposal: int, seq: int) -> dict:
+        search = await self.proposal_revisions.find_one({"proposal": proposal, "seq": seq})
+        if search is None:
+            raise KeyError
+        return search
+
+    async def insert_proposal(self, proposal: dict, body: str, timestamp: datetime):
+        """Insert a new proposal document along with its first revision."""
+        revision = {"seq": 1, "body": body, "timestamp": timestamp}
+        await self.proposals.insert_one(proposal | {"revision_count": 1, "latest_revision": revision})
+        await self.proposal_revisions.insert_one({"proposal": proposal["_id"]} | revision)
+
+    async def add_proposal_revision(self, proposal: int, body: str, timestamp: datetime):
+        counter = await self.proposals.find_one_and_update({"_id": proposal}, {"$inc": {"revision_count": 1}},
+                                                           projection={"revision_count": 1},
+                                                           return_document=ReturnDocument.AFTER)
+        revision = {"seq": counter["revision_count"], "body": body, "timestamp": timestamp}
+        await self.proposal_revisions.insert_one({"proposal": proposal} | revision)
+        # a slower concurrent revise mustn't overwrite a newer latest_revision
+        await self.proposals.update_one({"_id": proposal, "latest_revision.seq": {"$not": {"$gt": revision["seq"]}}},
+                                        {"$set": {"latest_revision": revision}})
+
+    async def migrate_proposal_revisions(self):
+        """Move revisions still embedded in proposal documents out to the proposal_revisions collection."""
+        async for proposal in self.proposals.find({"revisions.0": {"$exists": True}}, {"revisions": 1}):
+            revisions = [{"seq": seq, "body": revision["body"], "timestamp": revision["timestamp"]}
+                         for seq, revision in enumerate(proposal["revisions"], start=1)]
+            try:
+                await self.proposal_revisions.bulk_write([
+                    UpdateOne({"proposal": proposal["_id"], "seq": revision["seq"]}, {"$set": revision}, upsert=True)
+                    for revision in revisions
+                ], ordered=False)
+            except BulkWriteError as e:
+                # every worker runs this at startup, a duplicate key means another one upserted the same revision
+                if any(error["code"] != DUPLICATE_KEY for error in e.details["writeErrors"]):
+                    raise
+            await self.proposals.update_one({"_id": proposal["_id"]}, {
+                "$set": {"revision_count": len(revisions), "latest_revision": revisions[-1]},
+                "$unset": {"revisions": ""}
+            })
 
     async def get_party(self, query: dict) -> dict:
-        search = await self.query_parties(query)
-        if len(search) == 0:
+        search = await self.parties.find_one(query)
+        if search is None:
             raise KeyError
-        return search[0]
+        return (await self._with_leaders([search]))[0]
 
     async def get_user(self, query: dict) -> dict:
-        search = await self.query_users(query)
-        if len(search) == 0:
+        search = await self.users.find_one(query)
+        if search is None:
             raise KeyError
-        return search[0]
+        return self._with_party(search, await self.party_table.get())
 
     async def is_ballot_valid(self, election: str, ballot: ElectionBallot):
         election = await self.elections.find_one({"_id": election})
@@ -332,93 +593,48 @@ class Database:
                 raise InvalidBallotException(f"Caught unknown candidate: {candidate}")
         return True
 
+    async def process_election_results(self, election: str) -> dict:
+        """Tabulate an election's ranked ballots as an instant runoff and store the results on the election."""
+        search = await self.elections.find_one({"_id": election}, {"choices": 1, "ballots": 1})
+        remaining: List[ObjectId] = [ticket["_id"] for ticket in search["choices"]]
+        ballots: List[List[ObjectId]] = search.get("ballots", [])
+        rounds = []
+        winner = None
+        while remaining:
+            counts = {candidate: 0 for candidate in remaining}
+            for ballot in ballots:
+                for candidate in ballot:
+                    if candidate in counts:
+                        counts[candidate] += 1
+                        break
+            current_round = {"counts": {str(candidate): votes for candidate, votes in counts.items()},
+                             "eliminated": []}
+            rounds.append(current_round)
+            active = sum(counts.values())
+            if active == 0:
+                break
+            leader = max(remaining, key=lambda candidate: counts[candidate])
+            if counts[leader] * 2 > active or len(remaining) == 1:
+                winner = leader
+                break
+            lowest = min(counts.values())
+            eliminated = [candidate for candidate in remaining if counts[candidate] == lowest]
+            if len(eliminated) == len(remaining):
+                # everyone left is tied, no winner
+                break
+            current_round["eliminated"] = [str(candidate) for candidate in eliminated]
+            remaining = [candidate for candidate in remaining if candidate not in eliminated]
+        results = {
+            "winner": winner,
+            "total_ballots": len(ballots),
+            "rounds": rounds,
+            "timestamp": datetime.now(timezone.utc),
+        }
+        await self.elections.update_one({"_id": election}, {"$set": {"results": results}})
+        return results
+
     async def get_voter_status(self, user: ObjectId, election: str) -> VoterStatusModel:
-        pipeline = [
-            {
-                '$match': {
-                    '_id': election
-                }
-            }, {
-                '$project': {
-                    'voter': {
-                        '$arrayElemAt': [
-                            {
-                                '$filter': {
-                                    'input': '$voters',
-                                    'as': 'voter',
-                                    'cond': {
-                                        '$eq': [
-                                            '$$voter.user', user
-                                        ]
-                                    }
-                                }
-                            }, 0
-                        ]
-                    },
-                    'open': 1
-                }
-            }, {
-                '$set': {
-                    'user_is_voter': {
-                        '$cond': {
-                            'if': {
-                                '$gt': [
-                                    {
-                                        '$type': '$voter'
-                                    }, 'missing'
-                                ]
-                            },
-                            'then': True,
-                            'else': False
-                        }
-                    }
-                }
-            }, {
-                '$set': {
-                    'user_has_voted': {
-                        '$cond': {
-                            'if': {
-                                '$eq': [
-                                    '$user_is_voter', True
-                                ]
-                            },
-                            'then': '$voter.voted',
-                            'else': False
-                        }
-                    }
-                }
-            }, {
-                '$set': {
-                    'user_can_vote': {
-                        '$cond': {
-                            'if': {
-                                '$and': [
-                                    {
-                                        '$eq': [
-                                            '$open', True
-                                        ]
-                                    }, {
-                                        '$eq': [
-                                            '$user_is_voter', True
-                                        ]
-                                    }, {
-                                        '$eq': [
-                                            '$user_has_voted', False
-                                        ]
-                                    }
-                                ]
-                            },
-                            'then': True,
-                            'else': False
-                        }
-                    }
-                }
-            }, {
-                '$project': {
-                    'voter': 0
-                }
-            }
-        ]
+        pipeline = voter_status_pipeline(user, election)
         result = await self.elections.aggregate(pipeline).to_list(length=1)
         if result:
             return VoterStatusModel(**result[0])
@@ -1,13 +1,42 @@
-import os
-import yaml
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.read_preferences import SecondaryPreferred
+
+from config import get_config
+from database import slow_ops
+from metrics import MongoCommandListener, MongoPoolListener
 
-with open(os.path.join(os.environ["DATADIR"], "config.yml"), 'r') as file:
-    config: dict = yaml.safe_load(file)
 
 def get_connection() -> AsyncIOMotorClient:
     if not hasattr(get_connection, "conn"):
         print("connecting to database")
-        get_connection.conn = AsyncIOMotorClient(config["database"]["strudel"]["mongo_uri"])
+        strudel_config = get_config()["database"]["strudel"]
+        # any MongoClient keyword option, e.g. maxPoolSize, compressors, serverSelectionTimeoutMS, readPreference
+        get_connection.conn = AsyncIOMotorClient(strudel_config["mongo_uri"],
+                                                 event_listeners=[MongoCommandListener(), MongoPoolListener(),
+                                                                  slow_ops.listener],
+                                                 **strudel_config.get("client", {}))
     return get_connection.conn
 
+
+def secondary_reads() -> SecondaryPreferred:
+    if not hasattr(secondary_reads, "preference"):
+        # 90 seconds is the lowest bound the server accepts
+        max_staleness = get_config()["database"]["strudel"].get("secondary_max_staleness", 90)
+        secondary_reads.preference = SecondaryPreferred(max_staleness=max_staleness)
+    return secondary_reads.preference
+
+
+class LazyCollection:
+    """A collection handle that leaves creating the client to the first time it's actually used."""
+
+    def __init__(self, database: str, name: str, codec_options=None):
+        self.database = database
+        self.name = name
+        self.codec_options = codec_options
+        self._collection = None
+
+    def __getattr__(self, item):
+        if self._collection is None:
+            self._collection = get_connection().get_database(self.database).get_collection(self.name,
+                                                                                           self.codec_options)
+        return getattr(self._collection, item)
@@ -0,0 +1,29 @@
+def plan_stages(explain) -> list:
+    """Every stage name in the winning plan of an explain document, rejected plans are skipped."""
+    stages = []
+    if isinstance(explain, dict):
+        if isinstance(explain.get("stage"), str):
+            stages.append(explain["stage"])
+        for key, value in explain.items():
+            if key != "rejectedPlans":
+                stages.extend(plan_stages(value))
+    elif isinstance(explain, list):
+        for value in explain:
+            stages.extend(plan_stages(value))
+    return stages
+
+
+def first_execution_stats(explain):
+    if isinstance(explain, dict):
+        if isinstance(explain.get("executionStats"), dict):
+            return explain["executionStats"]
+        values = explain.values()
+    elif isinstance(explain, list):
+        values = explain
+    else:
+        return None
+    for value in values:
+        stats = first_execution_stats(value)
+        if stats is not None:
+            return stats
+    return None
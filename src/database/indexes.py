@@ -0,0 +1,117 @@
+from datetime import datetime, timezone
+from typing import NamedTuple, Optional
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, TEXT
+from pymongo.errors import OperationFailure
+
+from database.pagination import ALPHABETICAL
+
+
+class IndexSpec(NamedTuple):
+    collection: str
+    keys: list
+    options: dict = {}
+
+
+# every index the service relies on, applied idempotently at startup by ensure_indexes
+INDEXES = [
+    IndexSpec("users", [("dc_uuid", ASCENDING)], {"unique": True}),
+    IndexSpec("users", [("party", ASCENDING), ("inactive", ASCENDING)]),
+    IndexSpec("users", [("name", ASCENDING), ("_id", ASCENDING)], {"collation": ALPHABETICAL}),
+    IndexSpec("users", [("activity_score", DESCENDING), ("_id", DESCENDING)]),
+    IndexSpec("parties", [("name", ASCENDING), ("_id", ASCENDING)], {"collation": ALPHABETICAL}),
+    IndexSpec("parties", [("stats.members", DESCENDING), ("_id", DESCENDING)]),
+    IndexSpec("parties", [("stats.registered_members", DESCENDING), ("_id", DESCENDING)]),
+    IndexSpec("parties", [("stats.unity_score", DESCENDING), ("_id", DESCENDING)]),
+    IndexSpec("proposals", [("author", ASCENDING), ("_id", ASCENDING)]),
+    IndexSpec("proposals", [("title", TEXT), ("latest_revision.body", TEXT)],
+              {"weights": {"title": 10, "latest_revision.body": 1}, "name": "proposal_search"}),
+    IndexSpec("proposal_revisions", [("proposal", ASCENDING), ("seq", DESCENDING)], {"unique": True}),
+    IndexSpec("polls", [("voters.user", ASCENDING)]),
+    IndexSpec("polls", [("closes", ASCENDING)]),
+    IndexSpec("polls_v2", [("schedule.closed", ASCENDING)],
+              {"partialFilterExpression": {"schedule.opens": {"$exists": True}}}),
+    IndexSpec("polls_voters", [("poll", ASCENDING), ("user", ASCENDING)], {"unique": True}),
+    IndexSpec("polls_voters", [("user", ASCENDING)]),
+    IndexSpec("polls_ballots", [("poll", ASCENDING)]),
+    IndexSpec("elections", [("voters.user", ASCENDING)]),
+    IndexSpec("notifications", [("state", ASCENDING), ("_id", ASCENDING)]),
+    # delivered notifications are kept for a week
+    IndexSpec("notifications", [("sent", ASCENDING)], {"expireAfterSeconds": 7 * 24 * 60 * 60}),
+]
+
+
+async def ensure_indexes(database):
+    for spec in INDEXES:
+        try:
+            await database.get_collection(spec.collection).create_index(spec.keys, **spec.options)
+        except OperationFailure as e:
+            # e.g. duplicates blocking a unique index, don't keep the service from starting over it
+            print(f"could not create index {spec.keys} on {spec.collection}: {e}")
+
+
+class QueryShape(NamedTuple):
+    name: str
+    collection: str
+    command: dict
+    # small collections and maintenance jobs are fine scanning everything
+    allow_collscan: bool = False
+
+
+def find(collection: str, query: dict, sort: Optional[dict] = None, projection: Optional[dict] = None,
+         collation=None) -> dict:
+    command = {"find": collection, "filter": query}
+    if sort is not None:
+        command["sort"] = sort
+    if projection is not None:
+        command["projection"] = projection
+    if collation is not None:
+        command["collation"] = collation.document
+    return command
+
+
+def aggregate(collection: str, pipeline: list) -> dict:
+    return {"aggregate": collection, "pipeline": pipeline, "cursor": {}}
+
+
+def query_shapes() -> list:
+    """The query shapes Database, database.polls and the routers send, with placeholder values."""
+    oid = ObjectId()
+    now = datetime.now(timezone.utc)
+    return [
+        QueryShape("user by dc_uuid", "users", find("users", {"dc_uuid": "0"})),
+        QueryShape("user by id", "users", find("users", {"_id": oid})),
+        QueryShape("users by ids", "users", find("users", {"_id": {"$in": [oid]}})),
+        QueryShape("users by party", "users", find("users", {"party": oid, "inactive": False})),
+        QueryShape("users alphabetical", "users",
+                   find("users", {}, {"name": 1, "_id": 1}, collation=ALPHABETICAL)),
+        QueryShape("users by activity", "users", find("users", {}, {"activity_score": -1, "_id": -1})),
+        QueryShape("party members", "users", aggregate("users", [
+            {"$match": {"party": {"$in": [oid]}}},
+            {"$group": {"_id": "$party", "members": {"$sum": 1}}}
+        ])),
+        QueryShape("party table", "parties", find("parties", {}), allow_collscan=True),
+        QueryShape("parties by members", "parties", find("parties", {}, {"stats.members": -1, "_id": -1})),
+        QueryShape("parties by unity", "parties", find("parties", {}, {"stats.unity_score": -1, "_id": -1})),
+        QueryShape("role permissions", "roles", find("roles", {}), allow_collscan=True),
+        QueryShape("proposals by author", "proposals", find("proposals", {"author": oid}, {"_id": 1})),
+        QueryShape("proposal search", "proposals", find("proposals", {"$text": {"$search": "act"}})),
+        QueryShape("proposal revisions", "proposal_revisions",
+                   find("proposal_revisions", {"proposal": 1}, {"seq": -1})),
+        QueryShape("legacy vote lookup", "polls", find("polls", {"_id": oid, "voters.user": oid})),
+        QueryShape("legacy open polls", "polls", find("polls", {"closes": {"$gt": now}}, {"_id": 1})),
+        QueryShape("legacy polls voted in", "polls",
+                   find("polls", {"voters": {"$elemMatch": {"user": oid, "choice": {"$ne": None}}}})),
+        QueryShape("scheduled polls", "polls_v2",
+                   find("polls_v2", {"schedule.opens": {"$exists": True}, "schedule.closed": {"$ne": True}})),
+        QueryShape("scheduled elections", "elections",
+                   find("elections", {"schedule.opens": {"$exists": True}, "schedule.closed": {"$ne": True}}),
+                   allow_collscan=True),
+        QueryShape("poll voter", "polls_voters", find("polls_voters", {"poll": oid, "user": oid})),
+        QueryShape("poll ballots", "polls_ballots", find("polls_ballots", {"poll": oid})),
+        QueryShape("election voter", "elections", find("elections", {"voters.user": oid})),
+        QueryShape("sequence counter", "counters", find("counters", {"_id": "proposals"})),
+        QueryShape("pending notifications", "notifications",
+                   find("notifications", {"state": "pending"}, {"_id": 1})),
+    ]
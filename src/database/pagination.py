@@ -0,0 +1,76 @@
+import base64
+from typing import NamedTuple, Optional
+
+from bson import json_util
+from pymongo.collation import Collation
+
+# case-insensitive, so "alphabetical" doesn't put every capitalized name first
+ALPHABETICAL = Collation(locale="en", strength=2)
+
+
+class SortOption(NamedTuple):
+    field: str
+    direction: int
+    collation: Optional[Collation] = None
+
+
+class InvalidCursorException(Exception):
+    pass
+
+
+def _get_path(document: dict, path: str):
+    for key in path.split("."):
+        document = document.get(key) if isinstance(document, dict) else None
+    return document
+
+
+def encode_cursor(document: dict, sort: SortOption) -> str:
+    """Build an opaque cursor pointing just past document."""
+    position = [_get_path(document, sort.field), document["_id"]]
+    return base64.urlsafe_b64encode(json_util.dumps(position).encode()).decode()
+
+
+def keyset_filter(cursor: str, sort: SortOption) -> dict:
+    """Filter matching everything after cursor in (sort.field, _id) order."""
+    try:
+        position = json_util.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise InvalidCursorException("Invalid cursor")
+    # cursors come from clients, a dict here would be spliced into the filter as operators like $where or $ne
+    if not isinstance(position, list) or len(position) != 2 or any(isinstance(item, (dict, list))
+                                                                   for item in position):
+        raise InvalidCursorException("Invalid cursor")
+    value, last_id = position
+    operator = "$gt" if sort.direction == 1 else "$lt"
+    if sort.field == "_id":
+        return {"_id": {operator: last_id}}
+    # comparisons never match null or a missing field, yet those sort before everything else, so they need
+    # their own branches: after the non-null values when descending, ahead of them when ascending
+    if value is None:
+        after = [{sort.field: None, "_id": {operator: last_id}}]
+        if sort.direction == 1:
+            after.append({sort.field: {"$ne": None}})
+        return {"$or": after}
+    after = [{sort.field: {operator: value}}, {sort.field: value, "_id": {operator: last_id}}]
+    if sort.direction == -1:
+        after.append({sort.field: None})
+    return {"$or": after}
+
+
+async def page(collection, query: dict, sort: SortOption, limit: int, cursor: Optional[str] = None,
+               projection: Optional[dict] = None):
+    """Fetch up to limit documents in sort order, returning them with the cursor for the next page (or None)."""
+    if cursor is not None:
+        query = {"$and": [query, keyset_filter(cursor, sort)]}
+    keys = [(sort.field, sort.direction)]
+    if sort.field != "_id":
+        keys.append(("_id", sort.direction))
+    find = collection.find(query, projection).sort(keys).limit(limit + 1)
+    if sort.collation is not None:
+        find = find.collation(sort.collation)
+    documents = await find.to_list()
+    next_cursor = None
+    if len(documents) > limit:
+        documents = documents[:limit]
+        next_cursor = encode_cursor(documents[-1], sort)
+    return documents, next_cursor
@@ -0,0 +1,294 @@
+from bson import ObjectId
+
+
+def legacy_polls_pipeline(query: dict, include_voters: bool = True):
+    pipeline = [
+        {"$match": query},
+        {"$sort": {"_id": 1}},
+        {"$set": {"total_voters": {"$size": "$voters"}}},
+    ]
+    if include_voters is False:
+        pipeline.append({"$unset": "voters"})
+    return pipeline
+
+
+def legacy_votes_by_user_pipeline(exclude_polls: list):
+    return [
+        {"$match": {"_id": {"$nin": exclude_polls}, "voters.choice": {"$ne": None}}},
+        {"$unwind": "$voters"},
+        {"$match": {"voters.choice": {"$ne": None}}},
+        {"$group": {"_id": "$voters.user", "count": {"$sum": 1}}}
+    ]
+
+
+def poll_votes_by_user_pipeline():
+    return [
+        {"$match": {"voted": True}},
+        {"$group": {"_id": "$user", "count": {"$sum": 1}}}
+    ]
+
+
+def election_votes_by_user_pipeline():
+    return [
+        {"$match": {"voters.voted": True}},
+        {"$unwind": "$voters"},
+        {"$match": {"voters.voted": True}},
+        {"$group": {"_id": "$voters.user", "count": {"$sum": 1}}}
+    ]
+
+
+def proposals_by_author_pipeline():
+    return [
+        {"$group": {"_id": "$author", "count": {"$sum": 1}}}
+    ]
+
+
+def party_members_pipeline(user_query: dict):
+    return [
+        {"$match": user_query},
+        {"$group": {
+            "_id": "$party",
+            "members": {"$sum": 1},
+            "registered_members": {"$sum": {"$cond": [{"$eq": ["$inactive", False]}, 1, 0]}}
+        }}
+    ]
+
+
+def legacy_poll_choices_pipeline(polls: list):
+    return [
+        {"$match": {"_id": {"$in": polls}}},
+        {"$unwind": "$voters"},
+        {"$match": {"voters.choice": {"$ne": None}}},
+        {"$project": {"_id": 0, "poll": "$_id", "user": "$voters.user", "choice": "$voters.choice"}}
+    ]
+
+
+def poll_choices_pipeline(polls: list):
+    return [
+        {"$match": {"poll": {"$in": polls}, "ballot": {"$ne": None}}},
+        {"$lookup": {"from": "polls_ballots", "localField": "ballot", "foreignField": "_id", "as": "ballot"}},
+        {"$unwind": "$ballot"},
+        {"$project": {"_id": 0, "poll": 1, "user": 1, "choice": "$ballot.choice"}}
+    ]
+
+
+def voter_status_pipeline(user: ObjectId, election: str):
+    return [
+        {
+            '$match': {
+                '_id': election
+            }
+        }, {
+            '$project': {
+                'voter': {
+                    '$arrayElemAt': [
+                        {
+                            '$filter': {
+                                'input': '$voters',
+                                'as': 'voter',
+                                'cond': {
+                                    '$eq': [
+                                        '$$voter.user', user
+                                    ]
+                                }
+                            }
+                        }, 0
+                    ]
+                },
+                'open': 1
+            }
+        }, {
+            '$set': {
+                'user_is_voter': {
+                    '$cond': {
+                        'if': {
+                            '$gt': [
+                                {
+                                    '$type': '$voter'
+                                }, 'missing'
+                            ]
+                        },
+                        'then': True,
+                        'else': False
+                    }
+                }
+            }
+        }, {
+            '$set': {
+                'user_has_voted': {
+                    '$cond': {
+                        'if': {
+                            '$eq': [
+                                '$user_is_voter', True
+                            ]
+                        },
+                        'then': '$voter.voted',
+                        'else': False
+                    }
+                }
+            }
+        }, {
+            '$set': {
+                'user_can_vote': {
+                    '$cond': {
+                        'if': {
+                            '$and': [
+                                {
+                                    '$eq': [
+                                        '$open', True
+                                    ]
+                                }, {
+                                    '$eq': [
+                                        '$user_is_voter', True
+                                    ]
+                                }, {
+                                    '$eq': [
+                                        '$user_has_voted', False
+                                    ]
+                                }
+                            ]
+                        },
+                        'then': True,
+                        'else': False
+                    }
+                }
+            }
+        }, {
+            '$project': {
+                'voter': 0
+            }
+        }
+    ]
+
+
+def election_summary_pipeline(election: str):
+    return [
+        {
+            '$match': {"_id": election}
+        }, {
+            '$addFields': {
+                'total_voters': {
+                    '$size': '$voters'
+                },
+                'total_voted': {
+                    '$size': {
+                        '$filter': {
+                            'input': '$voters',
+                            'as': 'voter',
+                            'cond': {
+                                '$eq': [
+                                    '$$voter.voted', True
+                                ]
+                            }
+                        }
+                    }
+                }
+            }
+        }, {
+            '$project': {
+                'ballots': 0
+            }
+        }
+    ]
+
+
+def election_voters_pipeline(voter_filter: dict):
+    return [
+        {
+            '$match': voter_filter
+        }, {
+            '$set': {
+                'voted': False
+            }
+        }, {
+            '$project': {
+                'user': '$_id',
+                'voted': 1,
+                'party': 1,
+                '_id': 0
+            }
+        }
+    ]
+
+
+def leaderboard_pipeline():
+    return [
+        {
+            '$match': {
+                'inactive': False
+            }
+        }, {
+            '$group': {
+                '_id': '$party',
+                'count': {
+                    '$sum': 1
+                }
+            }
+        }, {
+            '$lookup': {
+                'from': 'parties',
+                'localField': '_id',
+                'foreignField': '_id',
+                'as': 'partyDetails'
+            }
+        }, {
+            '$unwind': {
+                'path': '$partyDetails',
+                'preserveNullAndEmptyArrays': True
+            }
+        }, {
+            '$project': {
+                '_id': 0,
+                'party': {
+                    '$cond': {
+                        'if': {
+                            '$eq': [
+                                '$_id', None
+                            ]
+                        },
+                        'then': 'Independent/Unaffiliated',
+                        'else': '$partyDetails.name'
+                    }
+                },
+                'count': 1
+            }
+        }, {
+            '$group': {
+                '_id': None,
+                'total': {
+                    '$sum': '$count'
+                },
+                'parties': {
+                    '$push': {
+                        'party': '$party',
+                        'count': '$count'
+                    }
+                }
+            }
+        }, {
+            '$unwind': '$parties'
+        }, {
+            '$project': {
+                '_id': 0,
+                'party': '$parties.party',
+                'count': '$parties.count',
+                'percentage': {
+                    '$round': [
+                        {
+                            '$multiply': [
+                                {
+                                    '$divide': [
+                                        '$parties.count', '$total'
+                                    ]
+                                }, 100
+                            ]
+                        }, 2
+                    ]
+                }
+            }
+        }, {
+            '$sort': {
+                'count': -1
+            }
+        }
+    ]
@@ -8,20 +8,17 @@ from unittest import case
 from bson import CodecOptions, ObjectId
 from pydantic import TypeAdapter
 
-from database.db_connection import get_connection
+from database.db_connection import LazyCollection
 from models import ObjectIdType
 from models.polls import PollModel, PollVoter, Ballot, StarBallot, ElectionChoice
 from .pipelines import fixed_poll_voters_pipeline
 
 options = CodecOptions(tz_aware=True)
 
-client = get_connection()
-db = client.get_database("strudel")
-
-polls = db.get_collection("polls_v2", options)
-voters = db.get_collection("polls_voters")
-ballots = db.get_collection("polls_ballots")
-users = db.get_collection("users")
+polls = LazyCollection("strudel", "polls_v2", options)
+voters = LazyCollection("strudel", "polls_voters")
+ballots = LazyCollection("strudel", "polls_ballots")
+users = LazyCollection("strudel", "users")
 
 def validate_ballot(poll: PollModel, ballot: Ballot):
     if ballot.ballot_type != poll.ballot_type:
@@ -120,6 +117,12 @@ async def process_results(poll_id: ObjectId):
                     tie += 1
             matrix[str(candidate_a.id)][str(candidate_b.id)] = {"win": win, "lose": lose, "tie": tie}
         await polls.update_one({"_id": poll.id}, {"$set": {"results.data.results_type": "star", "results.data.total_scores": ordered_total_scores,"results.data.preference_matrix": matrix}})
+    elif poll.ballot_type == "choose-one":
+        votes = {str(choice.id): 0 for choice in poll.choices}
+        async for count in ballots.aggregate([{"$match": {"poll": poll.id}},
+                                              {"$group": {"_id": "$choice", "votes": {"$sum": 1}}}]):
+            votes[str(count["_id"])] = count["votes"]
+        await polls.update_one({"_id": poll.id}, {"$set": {"results.data": {"results_type": "choose-one", "votes": votes}}})
 
 
 
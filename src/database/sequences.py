@@ -0,0 +1,35 @@
+import asyncio
+
+from pymongo import ReturnDocument
+
+
+class SequenceAllocator:
+    """Hands out values of a counter document, reserving block values per atomic increment.
+
+    A block of 1 is strict: every value is reserved when it's handed out, so values stay in order and the only
+    gaps come from callers that never use theirs. Larger blocks cut writes to the (contended) counter document
+    down to one per block, but unused values are lost when the process exits.
+    """
+
+    def __init__(self, counters, name: str, block: int = 1):
+        self.counters = counters
+        self.name = name
+        self.block = block
+        self._next = 1
+        self._end = 0
+        self._lock = asyncio.Lock()
+
+    async def next(self) -> int:
+        async with self._lock:
+            if self._next > self._end:
+                result = await self.counters.find_one_and_update(
+                    {'_id': self.name},
+                    {'$inc': {'sequence_value': self.block}},
+                    return_document=ReturnDocument.AFTER,
+                    upsert=True
+                )
+                self._end = result['sequence_value']
+                self._next = self._end - self.block + 1
+            value = self._next
+            self._next += 1
+            return value
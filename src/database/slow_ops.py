@@ -0,0 +1,129 @@
+import asyncio
+import json
+import time
+from datetime import datetime, timezone
+
+from pymongo import monitoring
+from pymongo.errors import CollectionInvalid, PyMongoError
+
+from database.explain import plan_stages, first_execution_stats
+from metrics import request_stats
+
+LOGGED_COMMANDS = {"find", "aggregate"}
+# added by the driver to every command, explain won't take them back
+DRIVER_FIELDS = {"lsid", "$clusterTime", "$db", "$readPreference", "readConcern", "txnNumber", "autocommit",
+                 "startTransaction", "apiVersion", "apiStrict", "apiDeprecationErrors"}
+
+
+def redact(value):
+    """Keep the structure of a filter or pipeline, drop the values that were queried for."""
+    if isinstance(value, dict):
+        return {key: redact(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [redact(item) for item in value]
+    if isinstance(value, str) and value.startswith("$"):
+        # field paths and variables
+        return value
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    return "?"
+
+
+def command_shape(command_name: str, command: dict) -> dict:
+    if command_name == "find":
+        return {key: redact(command[key]) for key in ("filter", "sort", "projection") if key in command}
+    return {"pipeline": redact(command.get("pipeline", []))}
+
+
+def summarize_explain(explain: dict) -> dict:
+    stats = first_execution_stats(explain) or {}
+    return {
+        "stages": list(dict.fromkeys(plan_stages(explain))),
+        "returned": stats.get("nReturned"),
+        "keys_examined": stats.get("totalKeysExamined"),
+        "docs_examined": stats.get("totalDocsExamined"),
+        "execution_ms": stats.get("executionTimeMillis"),
+    }
+
+
+class SlowOperationListener(monitoring.CommandListener):
+    """Logs finds and aggregates slower than a threshold to a capped collection.
+
+    Does nothing until start() hands it the event loop and the database to write to. Explaining and writing
+    happen on the loop, the listener itself only ever runs on the driver's threads.
+    """
+
+    def __init__(self):
+        self._loop = None
+        self._database = None
+        self._threshold_micros = 0
+        self._explain_interval = 0
+        self._commands = {}
+        self._explained = {}
+
+    def start(self, database, threshold_ms: float, explain_interval: float):
+        self._database = database
+        self._threshold_micros = threshold_ms * 1000
+        self._explain_interval = explain_interval
+        self._loop = asyncio.get_running_loop()
+
+    def started(self, event):
+        if self._loop is not None and event.command_name in LOGGED_COMMANDS:
+            self._commands[(event.connection_id, event.request_id)] = event.command
+
+    def succeeded(self, event):
+        command = self._commands.pop((event.connection_id, event.request_id), None)
+        if command is None or event.duration_micros < self._threshold_micros:
+            return
+        stats = request_stats.get()
+        route = stats.route if stats is not None else None
+        asyncio.run_coroutine_threadsafe(
+            self._record(event.command_name, command, event.duration_micros / 1000, route), self._loop)
+
+    def failed(self, event):
+        self._commands.pop((event.connection_id, event.request_id), None)
+
+    def _should_explain(self, key: str) -> bool:
+        # explain re-runs the query, so one slow shape hammering the server only gets explained once in a while
+        now = time.monotonic()
+        if now - self._explained.get(key, float("-inf")) < self._explain_interval:
+            return False
+        self._explained[key] = now
+        return True
+
+    async def _record(self, command_name: str, command: dict, duration_ms: float, route):
+        try:
+            shape = command_shape(command_name, command)
+            entry = {
+                "at": datetime.now(timezone.utc),
+                "route": route,
+                "command": command_name,
+                "collection": str(command[command_name]),
+                "shape": shape,
+                "duration_ms": round(duration_ms, 1),
+                "explain": None,
+            }
+            if self._should_explain(json.dumps([entry["collection"], command_name, shape])):
+                entry["explain"] = await self._explain(command)
+            await self._database.slow_ops.insert_one(entry)
+        except PyMongoError as e:
+            print(f"could not log slow {command_name}: {e}")
+
+    async def _explain(self, command: dict):
+        explained = {key: value for key, value in command.items() if key not in DRIVER_FIELDS}
+        database = self._database.client.get_database(command.get("$db", self._database.name))
+        try:
+            return summarize_explain(await database.command("explain", explained, verbosity="executionStats"))
+        except PyMongoError as e:
+            return {"error": str(e)}
+
+
+async def ensure_collection(database, size: int):
+    try:
+        await database.create_collection("slow_ops", capped=True, size=size)
+    except CollectionInvalid:
+        # already there, a size change means dropping it by hand
+        pass
+
+
+listener = SlowOperationListener()
@@ -0,0 +1,83 @@
+import asyncio
+import traceback
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+# "The $changeStream stage is only supported on replica sets"
+CHANGE_STREAMS_UNSUPPORTED = 40573
+DOCUMENT_CHANGES = {"insert", "update", "replace", "delete"}
+
+
+def user_document_handler(cache):
+    """A users handler for a cache of user documents keyed by dc_uuid, holding None for unregistered users."""
+
+    def handler(change):
+        if change is None:
+            cache.clear()
+        elif change["operationType"] == "insert" and "dc_uuid" in change["fullDocument"]:
+            # a registration replaces the cached "not registered"
+            cache.invalidate(change["fullDocument"]["dc_uuid"])
+        else:
+            user_id = change["documentKey"]["_id"]
+            cache.invalidate_where(lambda user: user is not None and user["_id"] == user_id)
+
+    return handler
+
+
+class InvalidationBus:
+    """Tails change streams and tells registered caches what changed, so every worker drops stale entries.
+
+    Handlers get the raw change event, or None when changes may have been missed (the collection was dropped,
+    the resume token fell off the oplog) and everything cached from that collection should go.
+    """
+
+    def __init__(self, retry_delay: float = 5):
+        self.retry_delay = retry_delay
+        self._collections = {}
+        self._handlers = {}
+        self._tokens = {}
+        self._tasks = []
+
+    def register(self, collection, handler):
+        self._collections[collection.name] = collection
+        self._handlers.setdefault(collection.name, []).append(handler)
+
+    def start(self):
+        loop = asyncio.get_running_loop()
+        for collection in self._collections.values():
+            self._tasks.append(loop.create_task(self._watch(collection)))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    def _publish(self, name: str, change):
+        for handler in self._handlers[name]:
+            try:
+                handler(change)
+            except Exception:
+                traceback.print_exc()
+
+    async def _watch(self, collection):
+        name = collection.name
+        while True:
+            try:
+                async with collection.watch(resume_after=self._tokens.get(name)) as stream:
+                    async for change in stream:
+                        self._tokens[name] = stream.resume_token
+                        self._publish(name, change if change["operationType"] in DOCUMENT_CHANGES else None)
+                # invalidated by a drop or rename, there's nothing to resume
+                self._tokens.pop(name, None)
+            except OperationFailure as e:
+                if e.code == CHANGE_STREAMS_UNSUPPORTED:
+                    print(f"not watching {name}, change streams need a replica set; its caches only expire by ttl")
+                    return
+                print(f"lost change stream on {name}: {e}")
+                self._tokens.pop(name, None)
+                self._publish(name, None)
+                await asyncio.sleep(self.retry_delay)
+            except PyMongoError as e:
+                # the driver already retried once, resume from the last token when the server is back
+                print(f"change stream on {name} failed: {e}")
+                await asyncio.sleep(self.retry_delay)
@@ -0,0 +1,71 @@
+import asyncio
+import time
+import traceback
+
+import aiohttp
+
+
+class LinkingIndex:
+    """An in-memory discordID -> mcPlayerUUID index of the discord linking database.
+
+    The index is refreshed in the background with conditional GETs, and a lookup that misses forces a refresh
+    (at most once every min_refresh_interval seconds) so players who just linked don't have to wait.
+    """
+
+    def __init__(self, url: str, refresh_interval: float = 300, min_refresh_interval: float = 10):
+        self.url = url
+        self.refresh_interval = refresh_interval
+        self.min_refresh_interval = min_refresh_interval
+        self._players = {}
+        self._etag = None
+        self._last_modified = None
+        self._refreshed = None
+        self._lock = asyncio.Lock()
+        self._session = None
+        self._task = None
+
+    async def refresh(self):
+        async with self._lock:
+            if self._refreshed is not None and time.monotonic() - self._refreshed < self.min_refresh_interval:
+                # someone else refreshed while we were waiting for the lock
+                return
+            headers = {}
+            if self._etag is not None:
+                headers["If-None-Match"] = self._etag
+            if self._last_modified is not None:
+                headers["If-Modified-Since"] = self._last_modified
+            if self._session is None:
+                self._session = aiohttp.ClientSession()
+            async with self._session.get(self.url, headers=headers) as response:
+                if response.status != 304:
+                    response.raise_for_status()
+                    linking_db = await response.json(content_type=None)
+                    self._players = {player["discordID"]: player["mcPlayerUUID"] for player in linking_db}
+                    self._etag = response.headers.get("ETag")
+                    self._last_modified = response.headers.get("Last-Modified")
+            self._refreshed = time.monotonic()
+
+    async def lookup(self, discord_id: str) -> str | None:
+        if discord_id not in self._players:
+            await self.refresh()
+        return self._players.get(discord_id)
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception:
+                traceback.print_exc()
+            await asyncio.sleep(self.refresh_interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
@@ -0,0 +1,68 @@
+import asyncio
+
+from fastapi import Request
+
+from shared import db
+
+
+class DataLoader:
+    """Batches loads of single keys made in the same event loop tick into one call of batch_fn.
+
+    batch_fn takes a list of keys and returns a dict of the ones it found. Results (including misses, which
+    come back as None) are cached for the lifetime of the loader, so keep loaders request scoped.
+    """
+
+    def __init__(self, batch_fn):
+        self.batch_fn = batch_fn
+        self._cache = {}
+        self._queue = []
+
+    def load(self, key) -> asyncio.Future:
+        future = self._cache.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._cache[key] = future
+            self._queue.append(key)
+            if len(self._queue) == 1:
+                loop.call_soon(lambda: asyncio.ensure_future(self._dispatch()))
+        return future
+
+    async def load_many(self, keys: list) -> list:
+        """Load keys in order, leaving out the ones that don't exist."""
+        results = await asyncio.gather(*(self.load(key) for key in keys))
+        return [result for result in results if result is not None]
+
+    async def _dispatch(self):
+        keys, self._queue = self._queue, []
+        try:
+            results = await self.batch_fn(keys)
+        except Exception as e:
+            for key in keys:
+                self._cache.pop(key).set_exception(e)
+            return
+        for key in keys:
+            self._cache[key].set_result(results.get(key))
+
+
+def _by_id(documents: list) -> dict:
+    return {document["_id"]: document for document in documents}
+
+
+class Loaders:
+    def __init__(self):
+        self.users = DataLoader(lambda ids: self._batch(db.query_users, ids))
+        self.parties = DataLoader(lambda ids: self._batch(db.query_parties, ids))
+        self.proposals = DataLoader(lambda ids: self._batch(db.query_proposals, ids))
+        self.polls = DataLoader(lambda ids: self._batch(
+            lambda query: db.query_polls(query, include_voters=False), ids))
+
+    @staticmethod
+    async def _batch(query, ids: list) -> dict:
+        return _by_id(await query({"_id": {"$in": ids}}))
+
+
+def get_loaders(request: Request) -> Loaders:
+    if not hasattr(request.state, "loaders"):
+        request.state.loaders = Loaders()
+    return request.state.loaders
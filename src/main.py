@@ -1,26 +1,48 @@
 import asyncio
+import secrets
 from contextlib import asynccontextmanager
+from typing import Annotated, Optional, Literal, List
 
 from bson import ObjectId
-from fastapi import FastAPI
+from fastapi import FastAPI, Query, HTTPException, Depends, Header
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi_discord import RateLimited, Unauthorized
 from fastapi_discord.exceptions import ClientSessionNotInitialized
 
+import metrics
 import models
-from bot import bot
-from routers import session, account, users, proposals, polls, elections, polls_v2
-from shared import discord, db, UserNotRegistered, config
+from database.pagination import InvalidCursorException
+from loaders import Loaders, get_loaders
+from routers import admin, session, account, users, proposals, polls, elections, polls_v2
+from scheduler import scheduler, load_schedules
+from shared import discord, db, UserNotRegistered, config, linking, invalidation
 
 
 # noinspection PyShadowingNames,PyUnusedLocal
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     await discord.init()
-
-    loop = asyncio.get_event_loop()
-    bot_task = loop.create_task(bot.client.start(config["discord"]["bot_token"]))
+    linking.start()
+    await db.ensure_indexes()
+    await db.start_slow_op_log()
+    await db.ensure_poll_counters()
+    await db.migrate_proposal_revisions()
+
+    # "external" leaves the bot and the scheduled jobs to `python -m bot`, so api workers can be scaled without
+    # starting more bots or running every job once per worker
+    embedded = config["discord"].get("bot_mode", "embedded") == "embedded"
+    if embedded:
+        db.register_member_counts(invalidation)
+    invalidation.start()
+    if embedded:
+        scheduler.start()
+        await load_schedules()
+        # py-cord and the bot's commands are only imported by the process that runs them
+        from bot import bot
+        loop = asyncio.get_event_loop()
+        bot_task = loop.create_task(bot.client.start(config["discord"]["bot_token"]))
+        delivery_task = loop.create_task(bot.deliver_notifications())
     yield
 
 
@@ -32,6 +54,7 @@ app.include_router(proposals.router)
 app.include_router(polls.router)
 app.include_router(elections.router)
 app.include_router(polls_v2.router)
+app.include_router(admin.router)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=config["cors_origins"],
@@ -39,11 +62,37 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(metrics.MetricsMiddleware)
+
+
+async def metrics_scraper(authorization: Annotated[Optional[str], Header()] = None):
+    # a static token from config, a scraper can't hold a discord session; without one the endpoint stays closed
+    token = config.get("metrics", {}).get("scrape_token")
+    if token is None or authorization is None or \
+            not secrets.compare_digest(authorization.encode(), f"Bearer {token}".encode()):
+        raise HTTPException(status_code=403)
+
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False, dependencies=[Depends(metrics_scraper)])
+async def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 
 @app.get("/parties/", response_model=models.PartyCollection)
-async def list_parties():
-    return models.PartyCollection(parties=await db.query_parties({}))
+async def list_parties(sort: Literal["alphabetical", "members", "registered_members", "seniority",
+                                    "unity_score"] = "alphabetical",
+                       limit: Annotated[int, Query(ge=1, le=500)] = 100, cursor: Optional[str] = None):
+    try:
+        parties, next_cursor = await db.page_parties({}, sort, limit, cursor, secondary=True)
+    except InvalidCursorException as e:
+        raise HTTPException(status_code=422, detail=e.args[0])
+    return models.PartyCollection(parties=parties, next_cursor=next_cursor)
+
+
+@app.get("/parties/batch", response_model=models.PartyCollection)
+async def batch_parties(ids: Annotated[List[models.ObjectIdType], Query(max_length=500)],
+                        loaders: Annotated[Loaders, Depends(get_loaders)]):
+    return models.PartyCollection(parties=await loaders.parties.load_many(ids))
 
 
 @app.get("/parties/{party_id}", response_model=models.PartyModel)
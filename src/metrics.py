@@ -0,0 +1,238 @@
+import bisect
+import contextvars
+import threading
+import time
+
+from pymongo import monitoring
+
+# seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class RequestStats:
+    """Mongo work attributed to the request currently being handled."""
+    __slots__ = ("scope", "commands", "seconds", "documents")
+
+    def __init__(self, scope: dict):
+        self.scope = scope
+        self.commands = 0
+        self.seconds = 0.0
+        self.documents = 0
+
+    @property
+    def route(self) -> str:
+        return route_path(self.scope)
+
+
+def route_path(scope: dict) -> str:
+    # fastapi puts the matched route in the scope, keep raw paths out so ids don't explode the labels
+    route = scope.get("route")
+    return route.path if route is not None else "unmatched"
+
+
+request_stats: contextvars.ContextVar[RequestStats | None] = contextvars.ContextVar("request_stats", default=None)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, description: str, labels: tuple):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: tuple, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            for labels, value in self._values.items():
+                lines.append(f"{self.name}{{{_labels(self.labels, labels)}}} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, labels: tuple, amount: float = 1):
+        self.inc(labels, -amount)
+
+
+class Histogram:
+    def __init__(self, name: str, description: str, labels: tuple, buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.buckets = buckets
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: tuple, value: float):
+        with self._lock:
+            counts, total = self._values.get(labels, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[labels] = (counts, total + value)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, (counts, total) in self._values.items():
+                label_text = _labels(self.labels, labels)
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), counts):
+                    cumulative += count
+                    lines.append(f'{self.name}_bucket{{{label_text},le="{bound}"}} {cumulative}')
+                lines.append(f"{self.name}_sum{{{label_text}}} {total}")
+                lines.append(f"{self.name}_count{{{label_text}}} {cumulative}")
+        return lines
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: tuple, values: tuple) -> str:
+    return ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+
+
+http_requests = Histogram("strudel_http_request_duration_seconds", "HTTP request latency by route.",
+                          ("method", "route", "status"))
+mongo_commands = Histogram("strudel_mongo_command_duration_seconds", "MongoDB command latency by command.",
+                           ("command",))
+mongo_failures = Counter("strudel_mongo_command_failures_total", "Failed MongoDB commands by command.", ("command",))
+route_mongo_commands = Counter("strudel_route_mongo_commands_total", "MongoDB commands sent, by route.",
+                               ("method", "route"))
+route_mongo_seconds = Counter("strudel_route_mongo_seconds_total", "Time spent in MongoDB commands, by route.",
+                              ("method", "route"))
+route_mongo_documents = Counter("strudel_route_mongo_documents_total", "Documents returned by MongoDB, by route.",
+                                ("method", "route"))
+pool_wait = Histogram("strudel_mongo_pool_wait_seconds", "Time spent waiting to check a connection out of the pool.",
+                      ("address",))
+pool_checkout_failures = Counter("strudel_mongo_pool_checkout_failures_total",
+                                 "Failed connection checkouts by reason.", ("address", "reason"))
+pool_checked_out = Gauge("strudel_mongo_pool_checked_out", "Connections currently checked out of the pool.",
+                         ("address",))
+
+METRICS = [http_requests, mongo_commands, mongo_failures, route_mongo_commands, route_mongo_seconds,
+           route_mongo_documents, pool_wait, pool_checkout_failures, pool_checked_out]
+
+
+def _returned_documents(reply) -> int:
+    cursor = reply.get("cursor")
+    if isinstance(cursor, dict):
+        return len(cursor.get("firstBatch", cursor.get("nextBatch", [])))
+    if reply.get("value") is not None:
+        return 1
+    return 0
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Times every command and charges it to the current request.
+
+    Motor runs pymongo on executor threads, but copies the caller's context over, so request_stats still
+    points at the request that sent the command.
+    """
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        seconds = event.duration_micros / 1_000_000
+        mongo_commands.observe((event.command_name,), seconds)
+        stats = request_stats.get()
+        if stats is not None:
+            stats.commands += 1
+            stats.seconds += seconds
+            stats.documents += _returned_documents(event.reply)
+
+    def failed(self, event):
+        seconds = event.duration_micros / 1_000_000
+        mongo_commands.observe((event.command_name,), seconds)
+        mongo_failures.inc((event.command_name,))
+        stats = request_stats.get()
+        if stats is not None:
+            stats.commands += 1
+            stats.seconds += seconds
+
+
+def _address(address: tuple) -> str:
+    return f"{address[0]}:{address[1]}"
+
+
+class MongoPoolListener(monitoring.ConnectionPoolListener):
+    """Tracks how long requests wait for a pooled connection, the sign that maxPoolSize is too small."""
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_checked_out(self, event):
+        pool_wait.observe((_address(event.address),), event.duration)
+        pool_checked_out.inc((_address(event.address),))
+
+    def connection_check_out_failed(self, event):
+        pool_wait.observe((_address(event.address),), event.duration)
+        pool_checkout_failures.inc((_address(event.address), event.reason))
+
+    def connection_checked_in(self, event):
+        pool_checked_out.dec((_address(event.address),))
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        pass
+
+
+class MetricsMiddleware:
+    """Records per-route latency and the Mongo work each request did."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = RequestStats(scope)
+        token = request_stats.set(stats)
+        status = 500
+        start = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            request_stats.reset(token)
+            path = route_path(scope)
+            http_requests.observe((scope["method"], path, status), time.perf_counter() - start)
+            route_mongo_commands.inc((scope["method"], path), stats.commands)
+            route_mongo_seconds.inc((scope["method"], path), stats.seconds)
+            route_mongo_documents.inc((scope["method"], path), stats.documents)
+
+
+def render() -> str:
+    return "\n".join(line for metric in METRICS for line in metric.render()) + "\n"
@@ -1,9 +1,9 @@
 from datetime import datetime, timezone
-from typing import List, Union, Literal, Optional, Any
+from typing import List, Union, Literal, Optional, Any, Dict
 
 from bson import ObjectId
 from fastapi_discord import User
-from pydantic import BaseModel, Field, model_validator
+from pydantic import BaseModel, Field, model_validator, AliasChoices
 from pydantic.functional_validators import BeforeValidator
 from pydantic_core import core_schema
 from typing_extensions import Annotated
@@ -25,10 +25,7 @@ class ObjectIdType(ObjectId):
                     core_schema.no_info_plain_validator_function(cls.validate),
                 ])
             ]),
-            serialization=core_schema.plain_serializer_function_ser_schema(
-                lambda x: str(x),
-                when_used='json'
-            ),
+            serialization=core_schema.to_string_ser_schema(when_used='json'),
         )
 
     @classmethod
@@ -73,12 +70,7 @@ class ErrorModel(BaseModel):
 
 
 class DocumentModel(BaseModel):
-    id: PyObjectId
-
-    @model_validator(mode='before')
-    def alias_values(cls, values):
-        values['id'] = values.pop("_id")
-        return values
+    id: PyObjectId = Field(validation_alias=AliasChoices("_id", "id"))
 
 
 class UserPartyModel(DocumentModel):
@@ -102,19 +94,28 @@ class PartyLeaderModel(DocumentModel):
     name: str
 
 
+class PartyStatsModel(BaseModel):
+    members: int = 0
+    registered_members: int = 0
+    unity_score: float = 0
+
+
 class PartyModel(DocumentModel):
     name: str
     shorthand: str
     color: str
     leader: Union[PartyLeaderModel, None]
+    stats: PartyStatsModel = Field(default_factory=PartyStatsModel)
 
 
 class UserCollection(BaseModel):
     users: List[UserModel]
+    next_cursor: Optional[str] = None
 
 
 class PartyCollection(BaseModel):
     parties: List[PartyModel]
+    next_cursor: Optional[str] = None
 
 
 class UserAccountModel(DocumentModel):
@@ -133,6 +134,33 @@ class RegistrationModel(BaseModel):
     pronouns: Pronoun
 
 
+class PermissionsModel(BaseModel):
+    permissions: List[str]
+
+
+class SlowOperationExplainModel(BaseModel):
+    stages: List[str] = []
+    returned: Optional[int] = None
+    keys_examined: Optional[int] = None
+    docs_examined: Optional[int] = None
+    execution_ms: Optional[int] = None
+    error: Optional[str] = None
+
+
+class SlowOperationModel(DocumentModel):
+    at: datetime
+    route: Optional[str]
+    command: str
+    collection: str
+    shape: Dict[str, Any]
+    duration_ms: float
+    explain: Optional[SlowOperationExplainModel]
+
+
+class SlowOperationCollection(BaseModel):
+    slow_ops: List[SlowOperationModel]
+
+
 class ServerInfoModel(BaseModel):
     login_url: str
 
@@ -152,16 +180,22 @@ class ReviseProposalModel(BaseModel):
 
 
 class ProposalRevisionModel(BaseModel):
+    seq: int
     body: str = Field(max_length=10000)
     timestamp: datetime
 
 
+class ProposalRevisionCollection(BaseModel):
+    revisions: List[ProposalRevisionModel]
+
+
 class ProposalModel(DocumentModel):
     title: str
     author: UserModel
     invalid: bool
     rejection_reason: str
     revisions: List[ProposalRevisionModel]
+    revision_count: int
     revisions_allowed: bool
 
 
@@ -173,6 +207,12 @@ class ProposalReferenceModel(DocumentModel):
 
 class ProposalCollection(BaseModel):
     proposals: List[ProposalReferenceModel]
+    next_cursor: Optional[str] = None
+
+
+class ProposalSearchResults(BaseModel):
+    proposals: List[ProposalReferenceModel]
+    next_offset: Optional[int] = None
 
 
 class PollChoice(BaseModel):
@@ -274,6 +314,18 @@ class ScheduleModel(BaseModel):
     closes: datetime
 
 
+class ElectionResultsRoundModel(BaseModel):
+    counts: Dict[str, int]
+    eliminated: List[str]
+
+
+class ElectionResultsModel(BaseModel):
+    winner: Optional[ObjectIdType]
+    total_ballots: int
+    rounds: List[ElectionResultsRoundModel]
+    timestamp: datetime
+
+
 class InsertElectionModel(BaseModel):
     slug: str = Field(serialization_alias="_id")
     title: str
@@ -3,7 +3,7 @@ from typing import List, Union, Literal, Dict, Annotated, Optional, Tuple
 from pydantic import BaseModel, Field, conint
 
 from models import ObjectIdType, InsertDocumentBaseModel, ElectionCandidateModel, ElectionCampaignModel, \
-    current_time_factory
+    current_time_factory, ScheduleModel
 
 
 # ballots
@@ -74,8 +74,12 @@ class StarResults(BaseModel):
     highlighted_races: List[Tuple[str, str]] = []
     preference_matrix: Dict[str, Dict[str, StarMatchupResults ]]
 
+class ChooseOneResults(BaseModel):
+    results_type: Literal["choose-one"]
+    votes: Dict[str, int]
+
 # polls
-PollResults = Union[StarResults]
+PollResults = Union[StarResults, ChooseOneResults]
 
 class PollResultsModel(BaseModel):
     public: bool = False
@@ -94,6 +98,7 @@ class PollModel(InsertDocumentBaseModel):
     voter_filter: VoterFilterModel = Field(default_factory=VoterFilterModel)
     dynamic_voters: bool = False
     secret: bool = False
+    schedule: Optional[ScheduleModel] = None
 
 class PollWithResultsModel(PollModel):
     results: PollResultsModel
@@ -0,0 +1,28 @@
+from functools import lru_cache
+from typing import Any
+
+from fastapi.responses import Response
+from pydantic import TypeAdapter
+
+
+@lru_cache(maxsize=None)
+def type_adapter(response_type) -> TypeAdapter:
+    return TypeAdapter(response_type)
+
+
+class ModelResponse(Response):
+    """JSON response validated against response_type once and serialized by pydantic-core.
+
+    Returning a Response skips FastAPI's response_model handling, which would validate the content a second
+    time and serialize it in Python. Keep response_model on the route for the schema.
+    """
+    media_type = "application/json"
+
+    def __init__(self, content: Any, response_type, status_code: int = 200, headers=None, background=None):
+        self.response_type = response_type
+        super().__init__(content, status_code, headers, background=background)
+
+    def render(self, content: Any) -> bytes:
+        adapter = type_adapter(self.response_type)
+        # by_alias like fastapi's response_model serialization, documents go out with "_id"
+        return adapter.dump_json(adapter.validate_python(content), by_alias=True)
@@ -1,14 +1,13 @@
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, BackgroundTasks
+from fastapi import APIRouter, Depends
 from fastapi_discord import User
 
-from bot import bot
-from models import RegistrationModel, UserModel, UserAccountModel
-from shared import discord, get_current_user, requires_registration, registration_allowed, db, get_minecraft_user, \
-    webapp_page
+from models import RegistrationModel, UserModel, UserAccountModel, PermissionsModel
+from shared import get_current_user, requires_registration, registration_allowed, db, get_minecraft_user, \
+    webapp_page, requires_authorization, get_discord_user, forget_user, notify
 
-router = APIRouter(dependencies=[Depends(discord.requires_authorization)], prefix="/account", tags=["Account"])
+router = APIRouter(dependencies=[Depends(requires_authorization)], prefix="/account", tags=["Account"])
 
 
 @router.get("/", dependencies=[Depends(requires_registration)], response_model=UserAccountModel)
@@ -16,18 +15,23 @@ async def get_account(current_user: Annotated[UserModel, Depends(get_current_use
     return current_user
 
 
+@router.get("/permissions", dependencies=[Depends(requires_registration)], response_model=PermissionsModel)
+async def get_account_permissions(current_user: Annotated[dict, Depends(get_current_user)]):
+    return {"permissions": sorted(await db.get_user_permissions(current_user["_id"]))}
+
+
 @router.post("/", dependencies=[Depends(registration_allowed)], response_model=UserAccountModel, status_code=201)
 async def register_user(minecraft_user: Annotated[str, Depends(get_minecraft_user)],
-                        user: Annotated[User, Depends(discord.user)], registration: RegistrationModel,
-                        background_tasks: BackgroundTasks):
+                        user: Annotated[User, Depends(get_discord_user)], registration: RegistrationModel):
     insert = await db.users.insert_one({
         "dc_uuid": user.id,
         "mc_uuid": minecraft_user,
         "name": registration.name,
         "pronouns": registration.pronouns,
         "inactive": False,
-        "party": None
+        "party": None,
+        "activity_score": 0
     })
-    background_tasks.add_task(bot.notify, message=f"New user registered: <@{user.id}>\n"
-                                                  f"<{webapp_page(f"/users/{str(insert.inserted_id)}")}>")
+    await notify(f"New user registered: <@{user.id}>\n<{webapp_page(f"/users/{str(insert.inserted_id)}")}>")
+    forget_user(user.id)
     return await db.get_user({"dc_uuid": user.id})
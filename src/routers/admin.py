@@ -0,0 +1,20 @@
+from typing import Annotated, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+
+from models import SlowOperationCollection
+from shared import db, get_current_user, requires_authorization
+
+
+async def diagnostics_permission(current_user: Annotated[dict, Depends(get_current_user)]):
+    if not await db.user_has_permission(current_user["_id"], "view_diagnostics"):
+        raise HTTPException(status_code=403)
+
+
+router = APIRouter(prefix="/admin", tags=["Admin"],
+                   dependencies=[Depends(requires_authorization), Depends(diagnostics_permission)])
+
+
+@router.get("/slow-ops", response_model=SlowOperationCollection)
+async def get_slow_ops(limit: Annotated[int, Query(ge=1, le=500)] = 100, route: Optional[str] = None):
+    return SlowOperationCollection(slow_ops=await db.get_slow_ops(limit, route))
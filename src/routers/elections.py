@@ -3,9 +3,13 @@ from typing import Annotated
 
 from fastapi import APIRouter, Depends, HTTPException
 
-from database import InvalidBallotException
-from models import InsertElectionModel, InsertElectionCandidateModel, ElectionBallot, GetElectionModel, VoterStatusModel
-from shared import db, get_current_user, discord
+from database import InvalidBallotException, VOTE_ACTIVITY
+from database.pipelines import election_summary_pipeline, election_voters_pipeline
+from models import InsertElectionModel, InsertElectionCandidateModel, ElectionBallot, GetElectionModel, VoterStatusModel, \
+    ElectionResultsModel
+from responses import ModelResponse
+from scheduler import schedule_election
+from shared import db, get_current_user, requires_authorization
 
 router = APIRouter(prefix="/elections", tags=["Elections"])
 
@@ -15,7 +19,7 @@ async def elections_permission(current_user: Annotated[dict, Depends(get_current
         raise HTTPException(status_code=403)
 
 
-manage_election_deps = dependencies = [Depends(discord.requires_authorization), Depends(elections_permission)]
+manage_election_deps = dependencies = [Depends(requires_authorization), Depends(elections_permission)]
 
 
 async def ballot_valid(election: str, ballot: ElectionBallot):
@@ -39,47 +43,19 @@ async def election_exists(election: str):
 async def user_can_vote(current_user: Annotated[dict, Depends(get_current_user)], election: str,
                         _election_exists=Depends(election_exists)):
     status = await db.get_voter_status(current_user["_id"], election)
-    print(status)
     if not status.user_can_vote:
         raise HTTPException(status_code=403)
 
 
 @router.get("/{election}", response_model=GetElectionModel, dependencies=[Depends(election_exists)])
 async def get_election(election: str):
-    pipeline = [
-        {
-            '$match': {"_id": election}
-        }, {
-            '$addFields': {
-                'total_voters': {
-                    '$size': '$voters'
-                },
-                'total_voted': {
-                    '$size': {
-                        '$filter': {
-                            'input': '$voters',
-                            'as': 'voter',
-                            'cond': {
-                                '$eq': [
-                                    '$$voter.voted', True
-                                ]
-                            }
-                        }
-                    }
-                }
-            }
-        }, {
-            '$project': {
-                'ballots': 0
-            }
-        }
-    ]
+    pipeline = election_summary_pipeline(election)
     search = await db.elections.aggregate(pipeline).to_list()
     return search[0]
 
 
 @router.get("/{election}/voter_status", response_model=VoterStatusModel,
-            dependencies=[Depends(discord.requires_authorization), Depends(election_exists)])
+            dependencies=[Depends(requires_authorization), Depends(election_exists)])
 async def get_voter_status(election: str, current_user: Annotated[dict, Depends(get_current_user)]):
     status = await db.get_voter_status(current_user["_id"], election)
     return status
@@ -87,7 +63,19 @@ async def get_voter_status(election: str, current_user: Annotated[dict, Depends(
 
 @router.post("/", dependencies=manage_election_deps)
 async def post_election(election: InsertElectionModel):
-    result = await db.elections.insert_one(election.model_dump(by_alias=True))
+    document = election.model_dump(by_alias=True)
+    result = await db.elections.insert_one(document)
+    schedule_election(document)
+
+
+@router.get("/{election}/results", response_model=ElectionResultsModel,
+            dependencies=manage_election_deps + [Depends(election_exists)])
+async def get_election_results(election: str):
+    search = await db.elections.find_one({"_id": election}, {"results": 1})
+    if search.get("results") is None:
+        # elections closed by hand never got their results precomputed
+        return ModelResponse(await db.process_election_results(election), ElectionResultsModel)
+    return ModelResponse(search["results"], ElectionResultsModel)
 
 
 @router.post("/{election}/candidate", dependencies=manage_election_deps)
@@ -102,22 +90,7 @@ async def add_voters(election: str):
         raise HTTPException(status_code=403, detail="This election is already open.")
     if search.get("voter_filter") is None:
         raise HTTPException(status_code=500, detail="No voter filter specified.")
-    pipeline = [
-        {
-            '$match': search["voter_filter"]
-        }, {
-            '$set': {
-                'voted': False
-            }
-        }, {
-            '$project': {
-                'user': '$_id',
-                'voted': 1,
-                'party': 1,
-                '_id': 0
-            }
-        }
-    ]
+    pipeline = election_voters_pipeline(search["voter_filter"])
     voters = await db.users.aggregate(pipeline).to_list()
     update = {
         "$set": {"voters": voters}
@@ -131,7 +104,7 @@ ballot_lock = asyncio.Lock()
 
 
 @router.post("/{election}/vote",
-             dependencies=[Depends(discord.requires_authorization), Depends(election_exists), Depends(ballot_valid)])
+             dependencies=[Depends(requires_authorization), Depends(election_exists), Depends(ballot_valid)])
 async def post_election_vote(current_user: Annotated[dict, Depends(get_current_user)], election: str,
                              ballot: ElectionBallot):
     update = {
@@ -145,9 +118,9 @@ async def post_election_vote(current_user: Annotated[dict, Depends(get_current_u
 
     async with ballot_lock:
         status = await db.get_voter_status(current_user["_id"], election)
-        print(status)
         if not status.user_can_vote:
             raise HTTPException(status_code=403)
         elif status.user_can_vote:
             await db.elections.update_one({"_id": election, "voters.user": current_user["_id"]}, update)
+            await db.record_activity(current_user["_id"], VOTE_ACTIVITY)
         return "voted!"
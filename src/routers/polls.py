@@ -3,12 +3,14 @@ from datetime import datetime, timedelta, timezone
 from typing import Annotated, List, Optional
 
 from bson import ObjectId
-from fastapi import APIRouter, Depends, BackgroundTasks, Query
+from fastapi import APIRouter, Depends, Query, HTTPException
 from pydantic import BaseModel
 
 import models
-from bot import bot
-from shared import db, discord, get_current_user, maybe_get_current_user, webapp_page
+from database import InvalidBallotException, VoteNotAllowedException
+from loaders import Loaders, get_loaders
+from responses import ModelResponse
+from shared import db, requires_authorization, get_current_user, maybe_get_current_user, webapp_page, notify
 
 router = APIRouter(prefix="/legacy/polls", tags=["Polls (legacy)"])
 
@@ -58,8 +60,14 @@ async def get_polls(filter_query: Annotated[FilterParams, Query()],
                 "choice": choice
             }}
         query.pop("i_voted")
-    search = await db.query_polls(query)
-    return {"polls": search}
+    search = await db.query_polls(query, include_voters=False, secondary=True)
+    return ModelResponse({"polls": search}, models.PollCollection)
+
+
+@router.get("/batch", response_model=models.PollCollection)
+async def batch_polls(ids: Annotated[List[models.ObjectIdType], Query(max_length=500)],
+                      loaders: Annotated[Loaders, Depends(get_loaders)]):
+    return ModelResponse({"polls": await loaders.polls.load_many(ids)}, models.PollCollection)
 
 
 @router.get("/{poll_id}", response_model=models.PollModel)
@@ -67,66 +75,22 @@ async def get_poll(poll_id: str):
     return await db.get_poll({"_id": ObjectId(poll_id)})
 
 
-async def after_vote(poll_id: str):
-    poll = await db.get_poll({"_id": ObjectId(poll_id)}, respect_secrets=False)
-    if poll["secret"] is True:
-        current_votes = sum(choice["votes"] for choice in poll["choices"])
-        if current_votes != poll["total_voters"]:
-            return
-    if poll["can_change_vote"] is False:
-        return
-    goal_name = ""
-    if poll["choices"][0]["votes"] >= poll["thresholds"][0]:
-        goal_name = "PASSED"
-    if poll["choices"][1]["votes"] >= poll["thresholds"][1]:
-        goal_name = "FAILED"
-    if goal_name != "":
-        await db.polls.update_one({"_id": ObjectId(poll_id)}, {"$set": {"can_change_vote": False}})
-        await bot.notify(f"{goal_name}: {poll["title"]}\n"
-                         f"<{webapp_page(f"/polls/{poll_id}")}>")
-
-
-@router.post("/{poll_id}/vote", dependencies=[Depends(discord.requires_authorization)])
+@router.post("/{poll_id}/vote", dependencies=[Depends(requires_authorization)])
 async def poll_vote(poll_id: str, current_user: Annotated[dict, Depends(get_current_user)],
-                    choice: models.PostPollVoteModel, background_tasks: BackgroundTasks):
-    # FIX THIS SHIT!!
-    pipeline = [
-        # Unwind the voters array
-        {"$unwind": "$voters"},
-        # Match the specific user
-        {"$match": {"_id": ObjectId(poll_id), "voters.user": ObjectId(current_user["_id"])}},
-        # Group back the original document and add the choice as a new field
-        {
-            "$group": {
-                "_id": "$_id",
-                "original_doc": {"$first": "$$ROOT"},
-                "user_choice": {"$first": "$voters.choice"}
-            }
-        },
-        # Add the user's choice as a new field in the original document
-        {
-            "$addFields": {
-                "original_doc.user_choice": "$user_choice"
-            }
-        },
-        # Replace the root to get the original document with the new field
-        {"$replaceRoot": {"newRoot": "$original_doc"}}
-    ]
-    search = await db.polls.aggregate(pipeline).to_list()
-    poll = search[0]
-    choices = [choice["body"] for choice in poll["choices"]]
-    if choice.body not in choices:
-        raise Exception
-    if poll["closes"] < datetime.now(timezone.utc):
-        raise Exception
-    if poll["can_change_vote"] is False and poll["user_choice"] is not None:
-        raise Exception
-    await db.polls.update_one({"_id": poll["_id"]}, {"$set": {"voters.$[elem].choice": choice.body}},
-                              array_filters=[{"elem.user": ObjectId(current_user["_id"])}])
-    background_tasks.add_task(after_vote, poll_id)
-
-
-@router.post("/", response_model=models.PollReferenceModel, dependencies=[Depends(discord.requires_authorization)])
+                    choice: models.PostPollVoteModel):
+    try:
+        settled = await db.cast_legacy_vote(ObjectId(poll_id), current_user["_id"], choice.body)
+    except KeyError:
+        raise HTTPException(status_code=403, detail="User is not eligible to vote in poll")
+    except VoteNotAllowedException as e:
+        raise HTTPException(status_code=403, detail=e.args[0])
+    except InvalidBallotException as e:
+        raise HTTPException(status_code=422, detail=e.args[0])
+    if settled is not None:
+        await notify(f"{settled["outcome"]}: {settled["title"]}\n<{webapp_page(f"/polls/{poll_id}")}>")
+
+
+@router.post("/", response_model=models.PollReferenceModel, dependencies=[Depends(requires_authorization)])
 async def post_poll(poll: models.PostPollModel, current_user: Annotated[dict, Depends(get_current_user)]):
     if current_user["dc_uuid"] != "928058365286973452":
         raise Exception
@@ -139,7 +103,7 @@ async def post_poll(poll: models.PostPollModel, current_user: Annotated[dict, De
         "title": poll.title,
         "proposal": poll.proposal,
         "secret": poll.secret,
-        "choices": [choice.model_dump() for choice in poll.choices],
+        "choices": [choice.model_dump() | {"votes": 0} for choice in poll.choices],
         "voters": voters,
         "timestamp": current_datetime,
         "closes": current_datetime + timedelta(days=3),
@@ -2,11 +2,14 @@ from typing import Annotated
 
 from bson import ObjectId
 from fastapi import APIRouter, Depends, HTTPException
-from database import polls
+from database import polls, VOTE_ACTIVITY
 from database.polls import create_poll, cast_vote, get_poll, users, voters, process_results
 from models import ObjectIdType
+from models import current_time_factory
 from models.polls import PollModel, PostBallot, TempVoterStatus, PollWithResultsModel
-from shared import discord, db, get_current_user, maybe_get_current_user
+from responses import ModelResponse
+from scheduler import schedule_poll, as_utc
+from shared import requires_authorization, db, get_current_user, maybe_get_current_user
 
 
 async def manage_polls_permission(current_user: Annotated[dict, Depends(get_current_user)]):
@@ -14,7 +17,7 @@ async def manage_polls_permission(current_user: Annotated[dict, Depends(get_curr
         raise HTTPException(status_code=403)
 
 
-manage_election_deps = [Depends(discord.requires_authorization), Depends(manage_polls_permission)]
+manage_election_deps = [Depends(requires_authorization), Depends(manage_polls_permission)]
 
 router = APIRouter(prefix="/polls", tags=["Polls"])
 
@@ -25,13 +28,16 @@ async def get__poll(poll_id: ObjectIdType):
 
 @router.post("/", dependencies=manage_election_deps, response_model=PollModel)
 async def post_poll(poll: PollModel):
+    if poll.schedule is not None and as_utc(poll.schedule.opens) > current_time_factory():
+        poll.open = False
     inserted_poll = await create_poll(poll)
+    schedule_poll(inserted_poll.model_dump(by_alias=True))
     return inserted_poll
 
-@router.post("/{poll_id}/vote", dependencies=[Depends(discord.requires_authorization)])
+@router.post("/{poll_id}/vote", dependencies=[Depends(requires_authorization)])
 async def post_poll_vote(poll_id: ObjectIdType, ballot: PostBallot, current_user: Annotated[dict, Depends(get_current_user)]):
-    print(ballot.model_dump())
     await cast_vote(poll_id, current_user["_id"], ballot.ballot)
+    await db.record_activity(current_user["_id"], VOTE_ACTIVITY)
     return
 
 @router.get("/{poll_id}/process_results", dependencies=manage_election_deps)
@@ -47,10 +53,10 @@ async def get_poll_results(poll_id: ObjectIdType, current_user: Annotated[dict,
             raise Exception
         if not await db.user_has_permission(current_user["_id"], "manage_polls"):
             raise HTTPException(status_code=403)
-    return poll
+    return ModelResponse(poll, PollWithResultsModel)
 
 
-@router.get("/{poll_id}/voter_status", dependencies=[Depends(discord.requires_authorization)], response_model=TempVoterStatus)
+@router.get("/{poll_id}/voter_status", dependencies=[Depends(requires_authorization)], response_model=TempVoterStatus)
 async def temp_voter_status(poll_id: ObjectIdType, current_user: Annotated[dict, Depends(get_current_user)]):
     poll = await get_poll(poll_id)
     if poll.open is False:
@@ -1,14 +1,16 @@
 import datetime
-from typing import Annotated, Optional
+from typing import Annotated, Optional, Literal, List
 
 from bson import ObjectId
-from fastapi import APIRouter, Depends, BackgroundTasks, Query
+from fastapi import APIRouter, Depends, Query, HTTPException
 from fastapi.responses import JSONResponse
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 import models
-from bot import bot
-from shared import db, get_current_user, discord, webapp_page
+from database import PROPOSAL_ACTIVITY
+from database.pagination import InvalidCursorException
+from loaders import Loaders, get_loaders
+from shared import db, get_current_user, requires_authorization, webapp_page, notify
 
 router = APIRouter(prefix="/proposals", tags=["Proposals"])
 
@@ -16,14 +18,41 @@ router = APIRouter(prefix="/proposals", tags=["Proposals"])
 class FilterParams(BaseModel):
     author: Optional[str] = None
     invalid: Optional[bool] = None
+    sort: Literal["oldest", "newest"] = "oldest"
+    limit: int = Field(default=100, ge=1, le=500)
+    cursor: Optional[str] = None
 
 
 @router.get("/", response_model=models.ProposalCollection)
 async def get_proposals(filter_query: Annotated[FilterParams, Query()]):
-    query = filter_query.model_dump(exclude_unset=True)
+    query = filter_query.model_dump(exclude_unset=True, exclude={"sort", "limit", "cursor"})
     if query.get("author"):
         query["author"] = ObjectId(query.pop("author"))
-    return {"proposals": await db.query_proposals(query)}
+    try:
+        proposals, next_cursor = await db.page_proposals(query, filter_query.sort, filter_query.limit,
+                                                         filter_query.cursor)
+    except InvalidCursorException as e:
+        raise HTTPException(status_code=422, detail=e.args[0])
+    return {"proposals": proposals, "next_cursor": next_cursor}
+
+
+@router.get("/search", response_model=models.ProposalSearchResults)
+async def search_proposals(q: Annotated[str, Query(min_length=1, max_length=200)],
+                           limit: Annotated[int, Query(ge=1, le=100)] = 20,
+                           offset: Annotated[int, Query(ge=0)] = 0):
+    # relevance order has no stable key to page on, so search pages by offset
+    proposals = await db.search_proposals(q, limit + 1, offset)
+    next_offset = None
+    if len(proposals) > limit:
+        proposals = proposals[:limit]
+        next_offset = offset + limit
+    return {"proposals": proposals, "next_offset": next_offset}
+
+
+@router.get("/batch", response_model=models.ProposalCollection)
+async def batch_proposals(ids: Annotated[List[int], Query(max_length=500)],
+                          loaders: Annotated[Loaders, Depends(get_loaders)]):
+    return {"proposals": await loaders.proposals.load_many(ids)}
 
 
 @router.get("/{proposal}", response_model=models.ProposalModel)
@@ -31,29 +60,39 @@ async def get_proposal(proposal: int):
     return await db.get_proposal({"_id": proposal})
 
 
-@router.post("/", dependencies=[Depends(discord.requires_authorization)], response_model=models.ProposalReferenceModel)
-async def post_proposal(proposal: models.PostProposalModel, current_user: Annotated[dict, Depends(get_current_user)],
-                        background_tasks: BackgroundTasks):
+@router.get("/{proposal}/revisions", response_model=models.ProposalRevisionCollection)
+async def get_proposal_revisions(proposal: int, before: Optional[int] = None,
+                                 limit: Annotated[int, Query(ge=1, le=100)] = 20):
+    return {"revisions": await db.get_proposal_revisions(proposal, before, limit)}
+
+
+@router.get("/{proposal}/revisions/{seq}", response_model=models.ProposalRevisionModel)
+async def get_proposal_revision(proposal: int, seq: int):
+    try:
+        return await db.get_proposal_revision(proposal, seq)
+    except KeyError:
+        raise HTTPException(status_code=404)
+
+
+@router.post("/", dependencies=[Depends(requires_authorization)], response_model=models.ProposalReferenceModel)
+async def post_proposal(proposal: models.PostProposalModel, current_user: Annotated[dict, Depends(get_current_user)]):
     s = await db.get_next_sequence_value("proposals")
     timestamp = datetime.datetime.now(tz=datetime.timezone.utc)
-    await db.proposals.insert_one({
+    await db.insert_proposal({
         "_id": s,
         "author": current_user["_id"],
         "title": proposal.title,
         "invalid": False,
         "rejection_reason": "",
         "revisions_allowed": True,
-        "revisions": [
-            {"timestamp": timestamp, "body": proposal.body}
-        ],
-    })
-    background_tasks.add_task(bot.notify,
-                              message=f"New proposal added by <@{current_user['dc_uuid']}>: {proposal.title}\n"
-                                      f"<{webapp_page(f"/proposals/{str(s)}")}>")
+    }, proposal.body, timestamp)
+    await db.record_activity(current_user["_id"], PROPOSAL_ACTIVITY)
+    await notify(f"New proposal added by <@{current_user['dc_uuid']}>: {proposal.title}\n"
+                 f"<{webapp_page(f"/proposals/{str(s)}")}>")
     return await db.get_proposal({"_id": s})
 
 
-@router.post("/{proposal}/revise", dependencies=[Depends(discord.requires_authorization)],
+@router.post("/{proposal}/revise", dependencies=[Depends(requires_authorization)],
              response_model=models.ProposalReferenceModel)
 async def revise_proposal(proposal: int, revision: models.ReviseProposalModel,
                           current_user: Annotated[dict, Depends(get_current_user)]):
@@ -62,8 +101,5 @@ async def revise_proposal(proposal: int, revision: models.ReviseProposalModel,
         return JSONResponse({"error": "Unauthorized"}, status_code=403)
     if proposal["revisions_allowed"] is False:
         return JSONResponse({"error": "Unauthorized"}, status_code=403)
-    db.proposals.update_one(
-        {"_id": proposal["_id"]},
-        {"$push": {"revisions": {"timestamp": datetime.datetime.now(tz=datetime.timezone.utc), "body": revision.body}}}
-    )
+    await db.add_proposal_revision(proposal["_id"], revision.body, datetime.datetime.now(tz=datetime.timezone.utc))
     return await db.get_proposal({"_id": proposal["_id"]})
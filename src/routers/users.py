@@ -1,10 +1,14 @@
-from typing import Optional, Annotated
+from typing import Optional, Annotated, Literal, List
 
 from bson import ObjectId
-from fastapi import APIRouter, Query
-from pydantic import BaseModel, BeforeValidator
+from fastapi import APIRouter, Query, HTTPException, Depends
+from pydantic import BaseModel, BeforeValidator, Field
 
 import models
+from database.pagination import InvalidCursorException
+from loaders import Loaders, get_loaders
+from models import ObjectIdType
+from responses import ModelResponse
 from shared import db
 
 router = APIRouter(prefix="/users", tags=["Users"])
@@ -19,14 +23,28 @@ def none_from_str(value: str) -> str | None:
 class FilterParams(BaseModel):
     party: Annotated[Optional[str], BeforeValidator(none_from_str)] = None
     inactive: Optional[bool] = None
+    sort: Literal["alphabetical", "activity", "server_seniority"] = "alphabetical"
+    limit: int = Field(default=100, ge=1, le=500)
+    cursor: Optional[str] = None
 
 
 @router.get("/", response_model=models.UserCollection)
 async def list_users(filter_query: Annotated[FilterParams, Query()]):
-    query = filter_query.model_dump(exclude_unset=True)
+    query = filter_query.model_dump(exclude_unset=True, exclude={"sort", "limit", "cursor"})
     if query.get("party"):
         query["party"] = ObjectId(query.pop("party"))
-    return models.UserCollection(users=await db.query_users(query))
+    try:
+        users, next_cursor = await db.page_users(query, filter_query.sort, filter_query.limit, filter_query.cursor,
+                                                 secondary=True)
+    except InvalidCursorException as e:
+        raise HTTPException(status_code=422, detail=e.args[0])
+    return ModelResponse({"users": users, "next_cursor": next_cursor}, models.UserCollection)
+
+
+@router.get("/batch", response_model=models.UserCollection)
+async def batch_users(ids: Annotated[List[ObjectIdType], Query(max_length=500)],
+                      loaders: Annotated[Loaders, Depends(get_loaders)]):
+    return ModelResponse({"users": await loaders.users.load_many(ids)}, models.UserCollection)
 
 
 @router.get("/{user_id}", response_model=models.UserModel)
@@ -0,0 +1,202 @@
+import asyncio
+import heapq
+import itertools
+import traceback
+from datetime import datetime, timezone, timedelta
+
+from bson import ObjectId
+
+from database import polls
+from shared import db, config
+
+
+def as_utc(value: datetime) -> datetime:
+    # the elections collection isn't tz aware, mongo hands back naive utc datetimes
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+class Scheduler:
+    """Runs coroutines at a given instant, backed by a timer heap on the running event loop."""
+
+    def __init__(self):
+        self._heap = []
+        self._counter = itertools.count()
+        self._keys = {}
+        self._wakeup = asyncio.Event()
+        self._task = None
+        # the loop only keeps weak references to tasks, a running callback could be garbage collected
+        self._fired = set()
+
+    def call_at(self, when: datetime, callback, *args, key=None):
+        """Schedule callback(*args) for when. Scheduling an existing key replaces the old timer."""
+        when = as_utc(when)
+        if key is not None:
+            existing = self._keys.get(key)
+            if existing is not None and existing[0] == when and existing[2] is callback and existing[3] == args:
+                # periodic reloads re-arm the same timers, don't pile cancelled copies into the heap
+                return
+            self.cancel(key)
+        entry = [when, next(self._counter), callback, args, key]
+        heapq.heappush(self._heap, entry)
+        if key is not None:
+            self._keys[key] = entry
+        self._wakeup.set()
+
+    def cancel(self, key):
+        entry = self._keys.pop(key, None)
+        if entry is not None:
+            # cancelled entries stay in the heap and get skipped once they're popped
+            entry[2] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            now = datetime.now(timezone.utc)
+            while self._heap and self._heap[0][0] <= now:
+                entry = heapq.heappop(self._heap)
+                _, _, callback, args, key = entry
+                if key is not None and self._keys.get(key) is entry:
+                    del self._keys[key]
+                if callback is not None:
+                    task = asyncio.create_task(self._fire(callback, args))
+                    self._fired.add(task)
+                    task.add_done_callback(self._fired.discard)
+            timeout = None
+            if self._heap:
+                timeout = (self._heap[0][0] - now).total_seconds()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    @staticmethod
+    async def _fire(callback, args):
+        try:
+            await callback(*args)
+        except Exception:
+            traceback.print_exc()
+
+
+scheduler = Scheduler()
+
+# how long a close may run before another timer is allowed to take it over
+CLOSE_LEASE = timedelta(minutes=10)
+
+
+# the "opened"/"closed" flags live next to opens/closes so a restart only reloads what hasn't fired yet,
+# and so a timer firing twice is harmless
+def _open_filter(document_id) -> dict:
+    # after downtime covering both opens and closes the two timers fire together, an open landing after the
+    # close must not reopen it
+    return {"_id": document_id, "schedule.opened": {"$ne": True},
+            "schedule.closes": {"$gt": datetime.now(timezone.utc)}, "schedule.closing": {"$exists": False}}
+
+
+async def _claim_close(collection, document_id) -> bool:
+    # reload_schedules re-arms everything not yet closed, including a close that's still running; the claim
+    # expires so a close cut short by a restart is picked up again
+    now = datetime.now(timezone.utc)
+    result = await collection.update_one({"_id": document_id, "schedule.closed": {"$ne": True},
+                                          "$or": [{"schedule.closing": {"$exists": False}},
+                                                  {"schedule.closing": {"$lte": now - CLOSE_LEASE}}]},
+                                         {"$set": {"open": False, "schedule.closing": now}})
+    return result.modified_count == 1
+
+
+async def open_election(election: str):
+    await db.elections.update_one(_open_filter(election), {"$set": {"open": True, "schedule.opened": True}})
+
+
+async def close_election(election: str):
+    if not await _claim_close(db.elections, election):
+        return
+    await db.process_election_results(election)
+    await db.elections.update_one({"_id": election}, {"$set": {"schedule.closed": True}})
+
+
+async def open_poll(poll_id: ObjectId):
+    await polls.polls.update_one(_open_filter(poll_id), {"$set": {"open": True, "schedule.opened": True}})
+
+
+async def close_poll(poll_id: ObjectId):
+    if not await _claim_close(polls.polls, poll_id):
+        return
+    await polls.process_results(poll_id)
+    await polls.polls.update_one({"_id": poll_id}, {"$set": {"schedule.closed": True}})
+    await db.refresh_party_unity()
+
+
+def _schedule(collection: str, document_id, schedule: dict, on_open, on_close):
+    if not scheduler.running:
+        # an api worker with discord.bot_mode external, the bot process arms it on its next reload_schedules
+        return
+    if schedule.get("opened") is not True:
+        scheduler.call_at(schedule["opens"], on_open, document_id, key=(collection, document_id, "open"))
+    if schedule.get("closed") is not True:
+        scheduler.call_at(schedule["closes"], on_close, document_id, key=(collection, document_id, "close"))
+
+
+def schedule_election(election: dict):
+    if election.get("schedule") is not None:
+        _schedule("elections", election["_id"], election["schedule"], open_election, close_election)
+
+
+def schedule_poll(poll: dict):
+    if poll.get("schedule") is not None:
+        _schedule("polls_v2", poll["_id"], poll["schedule"], open_poll, close_poll)
+
+
+async def load_schedules():
+    # also brings users from before activity scores existed up to date
+    scheduler.call_at(datetime.now(timezone.utc), rebuild_activity_scores, key="activity")
+    scheduler.call_at(datetime.now(timezone.utc), refresh_party_stats, key="party_stats")
+    await reload_schedules()
+
+
+async def reload_schedules():
+    # picks up elections and polls created by api workers that don't run the scheduler
+    try:
+        pending = {"schedule.opens": {"$exists": True}, "schedule.closed": {"$ne": True}}
+        async for election in db.elections.find(pending, {"schedule": 1}):
+            schedule_election(election)
+        async for poll in polls.polls.find(pending, {"schedule": 1}):
+            schedule_poll(poll)
+    finally:
+        interval = config.get("scheduler", {}).get("reload_interval", 60)
+        scheduler.call_at(datetime.now(timezone.utc) + timedelta(seconds=interval), reload_schedules,
+                          key="reload")
+
+
+async def rebuild_activity_scores():
+    try:
+        await db.rebuild_activity_scores()
+    finally:
+        interval = config.get("activity", {}).get("rebuild_interval", 6 * 60 * 60)
+        scheduler.call_at(datetime.now(timezone.utc) + timedelta(seconds=interval), rebuild_activity_scores,
+                          key="activity")
+
+
+async def refresh_party_stats():
+    # legacy polls close by time rather than through close_poll, so they're picked up here
+    try:
+        await db.refresh_party_members()
+        await db.refresh_party_unity()
+    finally:
+        interval = config.get("party_stats", {}).get("refresh_interval", 60 * 60)
+        scheduler.call_at(datetime.now(timezone.utc) + timedelta(seconds=interval), refresh_party_stats,
+                          key="party_stats")
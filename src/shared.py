@@ -1,16 +1,18 @@
-import os
-from typing import Annotated
+import hashlib
+from typing import Annotated, Optional
 from urllib.parse import urljoin
 
-import requests
-import yaml
 from fastapi import Depends, Request
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi_discord import DiscordOAuthClient, User, Unauthorized
 
+from cache import TTLCache, MISSING
+from config import get_config
 from database import Database
+from invalidation import InvalidationBus, user_document_handler
+from linking import LinkingIndex
 
-with open(os.path.join(os.environ["DATADIR"], "config.yml"), 'r') as file:
-    config: dict = yaml.safe_load(file)
+config = get_config()
 
 discord: DiscordOAuthClient = DiscordOAuthClient(
     config["discord"]["client_id"], config["discord"]["client_secret"], config["discord"]["redirect_url"], ["identify"]
@@ -18,6 +20,18 @@ discord: DiscordOAuthClient = DiscordOAuthClient(
 
 db: Database = Database()
 
+# every authenticated request used to cost a discord api call and a users aggregation,
+# these keep both for a short while so we also stay clear of discord's rate limits
+discord_users = TTLCache(config.get("cache", {}).get("session_ttl", 60))
+strudel_users = TTLCache(config.get("cache", {}).get("session_ttl", 60))
+
+# with more than one worker a cache is only as fresh as its ttl, unless change streams tell it otherwise
+invalidation = InvalidationBus()
+db.register_invalidation(invalidation)
+
+linking = LinkingIndex(config["database"]["discord_linking"]["url"],
+                       config["database"]["discord_linking"].get("refresh_interval", 300))
+
 
 class UserNotRegistered(Exception):
     """An Exception raised when user is authorized, but not registered."""
@@ -27,20 +41,57 @@ class RegistrationProhibited(Exception):
     """An Exception raised when the user is not allowed to register."""
 
 
-async def get_current_user(dc_user: Annotated[User, Depends(discord.user)]):
-    try:
-        return await db.get_user({"dc_uuid": dc_user.id})
-    except KeyError:
-        return None
+async def get_discord_user(request: Request) -> User:
+    if hasattr(request.state, "discord_user"):
+        return request.state.discord_user
+    key = hashlib.sha256(discord.get_token(request).encode()).hexdigest()
+    user = discord_users.get(key)
+    if user is MISSING:
+        user = await discord.user(request)
+        discord_users.set(key, user)
+    request.state.discord_user = user
+    return user
+
+
+async def requires_authorization(request: Request,
+                                 bearer: Annotated[Optional[HTTPAuthorizationCredentials], Depends(HTTPBearer())]):
+    if bearer is None:
+        raise Unauthorized
+    # a token that can fetch the user is an authorized one, no need for a separate /oauth2/@me call
+    await get_discord_user(request)
+
+
+async def get_current_user(request: Request, dc_user: Annotated[User, Depends(get_discord_user)]):
+    if hasattr(request.state, "current_user"):
+        return request.state.current_user
+    user = strudel_users.get(dc_user.id)
+    if user is MISSING:
+        try:
+            user = await db.get_user({"dc_uuid": dc_user.id})
+        except KeyError:
+            user = None
+        strudel_users.set(dc_user.id, user)
+    request.state.current_user = user
+    return user
 
 
 async def maybe_get_current_user(request: Request):
     try:
-        return await get_current_user(dc_user=await discord.user(request))
+        return await get_current_user(request, dc_user=await get_discord_user(request))
     except (KeyError, Unauthorized):
         return None
 
 
+def forget_user(dc_uuid: str):
+    """Drop a cached user document, call this whenever a user registers or their account changes."""
+    strudel_users.invalidate(dc_uuid)
+
+
+invalidation.register(db.users, user_document_handler(strudel_users))
+# cached users carry their party
+invalidation.register(db.parties, lambda change: strudel_users.clear())
+
+
 async def requires_registration(current_user: Annotated[dict, Depends(get_current_user)]):
     if current_user is not None:
         return True
@@ -55,13 +106,16 @@ async def registration_allowed(current_user: Annotated[dict, Depends(get_current
         raise RegistrationProhibited
 
 
-async def get_minecraft_user(user: Annotated[User, Depends(discord.user)]):
-    linking_db = requests.get(config["database"]["discord_linking"]["url"]).json()
+async def get_minecraft_user(user: Annotated[User, Depends(get_discord_user)]):
+    mc_uuid = await linking.lookup(user.id)
+    if mc_uuid is None:
+        raise RegistrationProhibited
+    return mc_uuid
+
 
-    for player in linking_db:
-        if player["discordID"] == user.id:
-            return player["mcPlayerUUID"]
-    raise RegistrationProhibited
+async def notify(message: str):
+    """Queue a message for the notifications channel, whichever process runs the bot delivers it."""
+    await db.enqueue_notification(message)
 
 
 def webapp_page(path: str):
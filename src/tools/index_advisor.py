@@ -0,0 +1,39 @@
+"""Explain every known query shape and flag the ones that fall back to a collection scan.
+
+Run from src/ with DATADIR pointing at a config.yml:
+
+    python -m tools.index_advisor [--database strudel]
+
+Exits with status 1 if a shape not marked allow_collscan in database.indexes scans its whole collection.
+"""
+import argparse
+import asyncio
+import sys
+
+from database.db_connection import get_connection
+from database.explain import plan_stages
+from database.indexes import query_shapes
+
+
+async def main(args) -> int:
+    database = get_connection().get_database(args.database)
+    flagged = 0
+    for shape in query_shapes():
+        explain = await database.command("explain", shape.command, verbosity="queryPlanner")
+        stages = plan_stages(explain)
+        if "COLLSCAN" in stages and not shape.allow_collscan:
+            status = "SCAN"
+            flagged += 1
+        else:
+            status = "ok"
+        print(f"{status:<5}{shape.collection:<20}{shape.name:<28}{' > '.join(dict.fromkeys(stages))}")
+    if flagged:
+        print(f"\n{flagged} query shape(s) scan a whole collection, see database/indexes.py")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--database", default="strudel")
+    sys.exit(asyncio.run(main(parser.parse_args())))
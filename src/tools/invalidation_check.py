@@ -0,0 +1,170 @@
+"""Check that writes to users, parties and roles evict the caches depending on them, through change streams.
+
+Seeds a scratch database, warms every cache the invalidation bus feeds, then writes to each watched collection and
+waits for the matching cache to see the change well before its ttl would have expired it.
+
+Run from src/ with DATADIR pointing at a config.yml whose mongo_uri is a throwaway replica set (change streams
+are refused by standalone servers, a single-node replica set is enough):
+
+    python -m tools.invalidation_check
+
+Exits with status 1 on any failure, CI runs it on every push.
+"""
+import argparse
+import asyncio
+import sys
+
+from bson import ObjectId
+
+from cache import TTLCache, MISSING
+from database import Database
+from database.db_connection import get_connection
+from invalidation import InvalidationBus, user_document_handler
+
+CHECK_DB = "strudel_invalidation_check"
+# every cache involved keeps entries for at least a minute, so anything seen within this was evicted
+TIMEOUT = 15
+
+
+async def eventually(condition) -> bool:
+    deadline = asyncio.get_running_loop().time() + TIMEOUT
+    while asyncio.get_running_loop().time() < deadline:
+        if await condition():
+            return True
+        await asyncio.sleep(0.1)
+    return False
+
+
+async def wait_for_streams(db: Database, seen: set):
+    # a change stream only sees writes made after its aggregate reached the server, poke each collection until
+    # its stream reports back
+    for collection in (db.users, db.parties, db.roles):
+        probes = []
+
+        async def probe_seen():
+            probe = ObjectId()
+            probes.append(probe)
+            await collection.insert_one({"_id": probe, "probe": True})
+            await asyncio.sleep(0.4)
+            return any(probe in seen for probe in probes)
+
+        if not await eventually(probe_seen):
+            raise TimeoutError(f"the change stream on {collection.name} never started")
+        await collection.delete_many({"_id": {"$in": probes}})
+
+
+async def main(args) -> int:
+    db = Database(args.database)
+    client = get_connection()
+    await client.drop_database(args.database)
+    bus = InvalidationBus(retry_delay=1)
+    sessions = TTLCache(600)
+    seen = set()
+    try:
+        party = ObjectId()
+        user = ObjectId()
+        await db.roles.insert_many([{"_id": "member", "permissions": ["vote"]},
+                                    {"_id": "admin", "permissions": ["view_diagnostics"]}])
+        await db.parties.insert_one({"_id": party, "name": "Old name", "shorthand": "P", "color": "red"})
+        await db.users.insert_one({"_id": user, "name": "before", "dc_uuid": "1", "mc_uuid": "1", "party": party,
+                                   "inactive": False, "roles": ["member"]})
+        await db.refresh_party_members()
+
+        db.register_invalidation(bus)
+        db.register_member_counts(bus)
+        bus.register(db.users, user_document_handler(sessions))
+        bus.register(db.parties, lambda change: sessions.clear())
+        for collection in (db.users, db.parties, db.roles):
+            bus.register(collection, lambda change: change is not None and seen.add(change["documentKey"]["_id"]))
+        bus.start()
+        await wait_for_streams(db, seen)
+
+        async def permissions():
+            return await db.get_user_permissions(user)
+
+        async def party_name():
+            return (await db.party_table.get())[party]["name"]
+
+        async def cache_session_user():
+            sessions.set("1", await db.get_user({"dc_uuid": "1"}))
+
+        async def party_members():
+            return (await db.parties.find_one({"_id": party}))["stats"]["members"]
+
+        # warm everything, then change it
+        await permissions()
+        await party_name()
+        await cache_session_user()
+        sessions.set("2", None)
+
+        async def role_changed():
+            await db.roles.update_one({"_id": "member"}, {"$push": {"permissions": "manage_polls"}})
+            return await eventually(lambda: _contains(permissions(), "manage_polls"))
+
+        async def user_roles_changed():
+            await db.users.update_one({"_id": user}, {"$push": {"roles": "admin"}})
+            return await eventually(lambda: _contains(permissions(), "view_diagnostics"))
+
+        async def party_changed():
+            await db.parties.update_one({"_id": party}, {"$set": {"name": "New name"}})
+            return await eventually(lambda: _equals(party_name(), "New name"))
+
+        async def user_changed():
+            await cache_session_user()
+            await db.users.update_one({"_id": user}, {"$set": {"name": "after"}})
+            return await eventually(lambda: _is_missing(sessions, "1"))
+
+        async def party_changed_session():
+            await cache_session_user()
+            await db.parties.update_one({"_id": party}, {"$set": {"color": "blue"}})
+            return await eventually(lambda: _is_missing(sessions, "1"))
+
+        async def user_registered():
+            await db.users.insert_one({"name": "new", "dc_uuid": "2", "mc_uuid": "2", "party": None,
+                                       "inactive": False})
+            return await eventually(lambda: _is_missing(sessions, "2"))
+
+        async def member_left():
+            await db.users.update_one({"_id": user}, {"$set": {"party": None}})
+            return await eventually(lambda: _equals(party_members(), 0))
+
+        checks = [
+            ("roles", "role permissions", role_changed),
+            ("users", "user roles", user_roles_changed),
+            ("parties", "party table", party_changed),
+            ("users", "session user", user_changed),
+            ("parties", "session users", party_changed_session),
+            ("users", "unregistered session", user_registered),
+            ("users", "party member counts", member_left),
+        ]
+        failed = 0
+        for collection, cache, check in checks:
+            ok = await check()
+            if not ok:
+                failed += 1
+            print(f"{'ok' if ok else 'FAIL':<5}{collection:<10}{cache}")
+    finally:
+        await bus.stop()
+        await client.drop_database(args.database)
+    if failed:
+        print(f"\n{failed} cache(s) weren't invalidated within {TIMEOUT}s")
+        return 1
+    return 0
+
+
+async def _contains(values, value) -> bool:
+    return value in await values
+
+
+async def _equals(actual, expected) -> bool:
+    return await actual == expected
+
+
+async def _is_missing(cache: TTLCache, key) -> bool:
+    return cache.get(key) is MISSING
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--database", default=CHECK_DB)
+    sys.exit(asyncio.run(main(parser.parse_args())))
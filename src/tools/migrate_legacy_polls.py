@@ -0,0 +1,133 @@
+"""Stream legacy polls into polls_v2, polls_voters and polls_ballots.
+
+Run from src/ with DATADIR pointing at a config.yml:
+
+    python -m tools.migrate_legacy_polls [--batch-size 500] [--dry-run]
+
+Legacy polls are read through a cursor in _id order and each closed one becomes a settled choose-one poll with
+the same _id. Polls still open are skipped, /legacy/polls/{id}/vote keeps taking votes on them, so they're
+migrated by a run after they close. Voter rows and ballots are written with bulk inserts of at most --batch-size
+documents, so memory stays bounded by a single legacy poll. Progress is checkpointed after every poll up to the
+first skipped one; rerunning picks up after the checkpoint and a poll that was only partly written is cleared
+and migrated again.
+"""
+import argparse
+import asyncio
+import random
+from datetime import datetime, timezone
+
+from bson import ObjectId
+
+from database import polls
+from database.db_connection import LazyCollection
+from models.polls import PollModel, TextChoice
+from shared import db
+
+CHECKPOINT = "migrate_legacy_polls"
+
+migrations = LazyCollection("strudel", "migrations")
+
+
+def convert_poll(legacy: dict, choice_ids: dict) -> dict:
+    poll = PollModel(**{
+        "_id": legacy["_id"],
+        "title": legacy["title"],
+        "choices": [TextChoice(**{"_id": choice_ids[choice["body"]], "text": choice["body"]})
+                    for choice in legacy["choices"]],
+        "timestamp": legacy["timestamp"],
+        "open": False,
+        "ballot_type": "choose-one",
+        "secret": legacy["secret"],
+        "schedule": {"opens": legacy["timestamp"], "closes": legacy["closes"]},
+    })
+    document = poll.model_dump(by_alias=True)
+    # only closed polls are migrated, there's nothing left for the scheduler to do
+    document["schedule"]["opened"] = True
+    document["schedule"]["closed"] = True
+    # legacy results were always public, process_results fills in the data
+    document["results"] = {"public": True, "data": None}
+    document["legacy"] = {
+        "proposal": legacy["proposal"],
+        "thresholds": legacy["thresholds"],
+        "can_change_vote": legacy["can_change_vote"],
+    }
+    return document
+
+
+async def flush(collection, documents: list):
+    if documents:
+        await collection.insert_many(documents, ordered=False)
+        documents.clear()
+
+
+async def migrate_poll(legacy: dict, batch_size: int):
+    existing = await polls.polls.find_one({"_id": legacy["_id"]}, {"choices": 1})
+    if existing is not None:
+        # keep the choice ids from an earlier run so reruns don't reshuffle them
+        choice_ids = {choice["text"]: choice["_id"] for choice in existing["choices"]}
+    else:
+        choice_ids = {choice["body"]: ObjectId() for choice in legacy["choices"]}
+    await polls.polls.replace_one({"_id": legacy["_id"]}, convert_poll(legacy, choice_ids), upsert=True)
+    await polls.voters.delete_many({"poll": legacy["_id"]})
+    await polls.ballots.delete_many({"poll": legacy["_id"]})
+
+    legacy_voters = legacy["voters"]
+    if legacy["secret"] is True:
+        # ballot ids are generated in order, don't let them give away who cast them
+        legacy_voters = random.sample(legacy_voters, len(legacy_voters))
+    voter_rows = []
+    ballot_rows = []
+    for legacy_voter in legacy_voters:
+        ballot = None
+        if legacy_voter["choice"] in choice_ids:
+            ballot = ObjectId()
+            ballot_rows.append({"_id": ballot, "poll": legacy["_id"], "ballot_type": "choose-one",
+                                "choice": choice_ids[legacy_voter["choice"]]})
+        voter_rows.append({
+            "poll": legacy["_id"],
+            "user": legacy_voter["user"],
+            "ballot": ballot if legacy["secret"] is False else None,
+            "voted": ballot is not None,
+        })
+        if len(voter_rows) >= batch_size:
+            await flush(polls.voters, voter_rows)
+        if len(ballot_rows) >= batch_size:
+            await flush(polls.ballots, ballot_rows)
+    await flush(polls.voters, voter_rows)
+    await flush(polls.ballots, ballot_rows)
+    await polls.process_results(legacy["_id"])
+
+
+async def main(args):
+    checkpoint = await migrations.find_one({"_id": CHECKPOINT}) or {}
+    query = {}
+    if checkpoint.get("last_poll") is not None:
+        query["_id"] = {"$gt": checkpoint["last_poll"]}
+        print(f"resuming after {checkpoint['last_poll']}")
+    migrated = 0
+    skipped = 0
+    now = datetime.now(timezone.utc)
+    cursor = db.polls.find(query).sort("_id", 1).batch_size(args.batch_size)
+    async for legacy in cursor:
+        if legacy["closes"] > now:
+            # still taking votes on the legacy side, the checkpoint stays before it so a later run picks it up
+            skipped += 1
+            continue
+        if args.dry_run is False:
+            await migrate_poll(legacy, args.batch_size)
+            if skipped == 0:
+                await migrations.update_one({"_id": CHECKPOINT}, {"$set": {"last_poll": legacy["_id"]}},
+                                            upsert=True)
+        migrated += 1
+        if migrated % 100 == 0:
+            print(f"{migrated} polls migrated")
+    print(f"done, {migrated} polls migrated" + (" (dry run)" if args.dry_run else ""))
+    if skipped:
+        print(f"{skipped} polls are still open, rerun once they've closed")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true")
+    asyncio.run(main(parser.parse_args()))
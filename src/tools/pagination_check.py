@@ -0,0 +1,104 @@
+"""Check that keyset pagination returns every document exactly once, in order, for every list sort.
+
+Seeds a scratch database where a share of users have no activity_score and a share of parties have null or
+missing stats, then walks each sort of USER_SORTS and PARTY_SORTS a few documents at a time and compares the
+pages with a single sorted find.
+
+Run from src/ with DATADIR pointing at a config.yml whose mongo_uri is a throwaway mongod:
+
+    python -m tools.pagination_check
+
+Exits with status 1 on any failure, CI runs it on every push.
+"""
+import argparse
+import asyncio
+import random
+import sys
+
+from bson import ObjectId
+
+from database import USER_SORTS, PARTY_SORTS
+from database.db_connection import get_connection
+from database.indexes import ensure_indexes
+from database.pagination import SortOption, page
+
+CHECK_DB = "strudel_pagination_check"
+PAGE_SIZE = 7
+
+
+def maybe_null(value):
+    # missing and null sort the same way, both have to survive a cursor
+    return random.choice([value, value, None, ...])
+
+
+async def seed(database):
+    random.seed(0)
+    users = []
+    for i in range(60):
+        user = {"_id": ObjectId(), "name": f"user{i % 20}", "dc_uuid": str(i), "mc_uuid": str(i)}
+        score = maybe_null(random.randint(0, 5))
+        if score is not ...:
+            user["activity_score"] = score
+        users.append(user)
+    await database.users.insert_many(users)
+    parties = []
+    for i in range(40):
+        party = {"_id": ObjectId(), "name": f"Party {i % 15}", "shorthand": f"P{i}", "color": "red"}
+        stats = {key: value for key, value in (("members", maybe_null(random.randint(0, 3))),
+                                               ("registered_members", maybe_null(random.randint(0, 3))),
+                                               ("unity_score", maybe_null(random.choice([0.5, 1.0]))))
+                 if value is not ...}
+        if i % 4:
+            party["stats"] = stats
+        parties.append(party)
+    await database.parties.insert_many(parties)
+
+
+async def sorted_ids(collection, sort: SortOption) -> list:
+    keys = [(sort.field, sort.direction)]
+    if sort.field != "_id":
+        keys.append(("_id", sort.direction))
+    find = collection.find({}, {"_id": 1}).sort(keys)
+    if sort.collation is not None:
+        find = find.collation(sort.collation)
+    return [document["_id"] for document in await find.to_list()]
+
+
+async def paged_ids(collection, sort: SortOption) -> list:
+    ids = []
+    cursor = None
+    while True:
+        documents, cursor = await page(collection, {}, sort, PAGE_SIZE, cursor)
+        ids += [document["_id"] for document in documents]
+        if cursor is None:
+            return ids
+
+
+async def main(args) -> int:
+    client = get_connection()
+    await client.drop_database(args.database)
+    database = client.get_database(args.database)
+    failed = 0
+    try:
+        await seed(database)
+        await ensure_indexes(database)
+        checks = [("users", name, sort) for name, sort in USER_SORTS.items()]
+        checks += [("parties", name, sort) for name, sort in PARTY_SORTS.items()]
+        for collection, name, sort in checks:
+            expected = await sorted_ids(database[collection], sort)
+            ok = await paged_ids(database[collection], sort) == expected
+            if not ok:
+                failed += 1
+            print(f"{'ok' if ok else 'FAIL':<5}{collection:<10}{name}")
+    finally:
+        await client.drop_database(args.database)
+    if failed:
+        print(f"\n{failed} sort(s) skipped or repeated documents across pages")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--database", default=CHECK_DB)
+    sys.exit(asyncio.run(main(parser.parse_args())))
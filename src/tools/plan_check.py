@@ -0,0 +1,201 @@
+"""Query-plan regression check for every aggregation pipeline and query shape.
+
+Seeds a scratch database, builds the registered indexes, explains every pipeline from database.pipelines and
+database.polls.pipelines (plus the find shapes from database.indexes) and fails when a plan regresses:
+
+- an $unwind running before the pipeline's first $match
+- a collection scan where an index should be used
+- more documents examined than max_examined_ratio per document returned
+
+Run from src/ with DATADIR pointing at a config.yml whose mongo_uri is a throwaway mongod:
+
+    python -m tools.plan_check
+
+Exits with status 1 on any failure, CI runs it on every push.
+"""
+import argparse
+import asyncio
+import random
+import sys
+from datetime import datetime, timedelta, timezone
+from typing import NamedTuple
+
+from bson import ObjectId
+
+from database import pipelines
+from database.db_connection import get_connection
+from database.explain import plan_stages, first_execution_stats
+from database.indexes import ensure_indexes, query_shapes
+from database.polls.pipelines import fixed_poll_voters_pipeline
+
+CHECK_DB = "strudel_plan_check"
+
+
+class PlanCase(NamedTuple):
+    name: str
+    collection: str
+    pipeline: list
+    # full passes (maintenance jobs, whole-population commands) are allowed to scan
+    allow_collscan: bool = False
+    max_examined_ratio: float = 2.0
+
+
+async def seed(database) -> dict:
+    rng = random.Random(0)
+    now = datetime.now(timezone.utc)
+    parties = [{"_id": ObjectId(), "name": f"Party {i}", "shorthand": f"P{i}", "color": "red", "leader": None}
+               for i in range(5)]
+    users = [{
+        "_id": ObjectId(),
+        "name": f"user{i}",
+        "dc_uuid": str(i),
+        "mc_uuid": str(i),
+        "pronouns": "they",
+        "inactive": rng.random() < 0.2,
+        "party": rng.choice(parties)["_id"] if rng.random() < 0.8 else None,
+        "activity_score": rng.randint(0, 50),
+    } for i in range(300)]
+    await database.parties.insert_many(parties)
+    await database.users.insert_many(users)
+
+    tickets = [{"_id": ObjectId(), "candidate": {"name": f"Candidate {i}"}} for i in range(3)]
+    elections = [{
+        "_id": f"election-{i}",
+        "title": f"Election {i}",
+        "open": i == 0,
+        "choices": tickets,
+        "voters": [{"user": user["_id"], "voted": rng.random() < 0.5, "party": user["party"]} for user in users],
+        "ballots": [[ticket["_id"] for ticket in rng.sample(tickets, 3)] for _ in range(100)],
+    } for i in range(3)]
+    await database.elections.insert_many(elections)
+
+    legacy_polls = []
+    for i in range(200):
+        voters = [{"user": user["_id"], "choice": rng.choice(["Yes", "No", None])} for user in rng.sample(users, 50)]
+        legacy_polls.append({
+            "_id": ObjectId(),
+            "title": f"Poll {i}",
+            "proposal": i,
+            "secret": i % 5 == 0,
+            "choices": [{"body": body, "votes": sum(voter["choice"] == body for voter in voters)}
+                        for body in ["Yes", "No"]],
+            "voters": voters,
+            "timestamp": now - timedelta(days=i),
+            "closes": now + timedelta(days=3 - i),
+            "can_change_vote": True,
+            "thresholds": [26, 25],
+        })
+    await database.polls.insert_many(legacy_polls)
+
+    v2_polls = [{"_id": ObjectId(), "title": f"Poll {i}", "open": i % 2 == 0, "secret": False,
+                 "ballot_type": "choose-one", "choices": [{"_id": ObjectId(), "text": "Yes"}]} for i in range(50)]
+    await database.polls_v2.insert_many(v2_polls)
+    voters = []
+    ballots = []
+    for poll in v2_polls:
+        for user in rng.sample(users, 50):
+            ballot = ObjectId()
+            ballots.append({"_id": ballot, "poll": poll["_id"], "ballot_type": "choose-one",
+                            "choice": poll["choices"][0]["_id"]})
+            voters.append({"poll": poll["_id"], "user": user["_id"], "ballot": ballot, "voted": True})
+    await database.polls_voters.insert_many(voters)
+    await database.polls_ballots.insert_many(ballots)
+
+    await database.proposals.insert_many([{
+        "_id": i,
+        "author": rng.choice(users)["_id"],
+        "title": f"An act to do thing {i}",
+        "invalid": False,
+        "latest_revision": {"seq": 1, "body": "text", "timestamp": now},
+        "revision_count": 1,
+    } for i in range(1, 101)])
+
+    return {
+        "user": users[0]["_id"],
+        "party": parties[0]["_id"],
+        "election": elections[0]["_id"],
+        "legacy_poll": legacy_polls[0]["_id"],
+        "legacy_polls": [poll["_id"] for poll in legacy_polls[:10]],
+        "v2_polls": [poll["_id"] for poll in v2_polls[:10]],
+        "now": now,
+    }
+
+
+def plan_cases(ids: dict) -> list:
+    return [
+        PlanCase("legacy poll detail", "polls", pipelines.legacy_polls_pipeline({"_id": ids["legacy_poll"]})),
+        PlanCase("legacy open polls", "polls",
+                 pipelines.legacy_polls_pipeline({"closes": {"$gt": ids["now"]}}, include_voters=False)),
+        PlanCase("legacy polls i can vote in", "polls",
+                 pipelines.legacy_polls_pipeline({"voters": {"$elemMatch": {"user": ids["user"]}}}, False)),
+        PlanCase("election voter status", "elections", pipelines.voter_status_pipeline(ids["user"], ids["election"])),
+        PlanCase("election summary", "elections", pipelines.election_summary_pipeline(ids["election"])),
+        PlanCase("election voters by party", "users",
+                 pipelines.election_voters_pipeline({"party": ids["party"], "inactive": False})),
+        PlanCase("poll voters by party", "users",
+                 fixed_poll_voters_pipeline({"party": ids["party"], "inactive": False}, ids["legacy_poll"])),
+        PlanCase("party members", "users", pipelines.party_members_pipeline({"party": {"$in": [ids["party"]]}})),
+        PlanCase("legacy poll choices", "polls", pipelines.legacy_poll_choices_pipeline(ids["legacy_polls"])),
+        PlanCase("poll choices", "polls_voters", pipelines.poll_choices_pipeline(ids["v2_polls"]),
+                 max_examined_ratio=1.0),
+        PlanCase("leaderboard", "users", pipelines.leaderboard_pipeline(), allow_collscan=True),
+        PlanCase("legacy votes by user", "polls", pipelines.legacy_votes_by_user_pipeline([]), allow_collscan=True),
+        PlanCase("poll votes by user", "polls_voters", pipelines.poll_votes_by_user_pipeline(), allow_collscan=True),
+        PlanCase("election votes by user", "elections", pipelines.election_votes_by_user_pipeline(),
+                 allow_collscan=True),
+        PlanCase("proposals by author", "proposals", pipelines.proposals_by_author_pipeline(), allow_collscan=True),
+    ]
+
+
+def check_pipeline(case: PlanCase) -> list:
+    stages = [next(iter(stage)) for stage in case.pipeline]
+    if "$unwind" in stages and ("$match" not in stages or stages.index("$unwind") < stages.index("$match")):
+        return ["$unwind runs before the first $match"]
+    return []
+
+
+def check_plan(explain: dict, allow_collscan: bool, max_examined_ratio: float) -> list:
+    failures = []
+    if "COLLSCAN" in plan_stages(explain) and not allow_collscan:
+        failures.append("collection scan")
+    stats = first_execution_stats(explain)
+    if stats is not None and not allow_collscan:
+        examined = stats.get("totalDocsExamined", 0)
+        returned = max(stats.get("nReturned", 0), 1)
+        if examined > returned * max_examined_ratio:
+            failures.append(f"examined {examined} docs for {returned} returned")
+    return failures
+
+
+async def main(args) -> int:
+    client = get_connection()
+    await client.drop_database(args.database)
+    database = client.get_database(args.database)
+    failed = 0
+    try:
+        ids = await seed(database)
+        await ensure_indexes(database)
+        checks = [(case.name, case.collection,
+                   {"aggregate": case.collection, "pipeline": case.pipeline, "cursor": {}},
+                   case.allow_collscan, case.max_examined_ratio, check_pipeline(case))
+                  for case in plan_cases(ids)]
+        checks += [(shape.name, shape.collection, shape.command, shape.allow_collscan, 2.0, [])
+                   for shape in query_shapes()]
+        for name, collection, command, allow_collscan, ratio, failures in checks:
+            explain = await database.command("explain", command, verbosity="executionStats")
+            failures = failures + check_plan(explain, allow_collscan, ratio)
+            if failures:
+                failed += 1
+            print(f"{'FAIL' if failures else 'ok':<5}{collection:<20}{name:<30}{'; '.join(failures)}")
+    finally:
+        await client.drop_database(args.database)
+    if failed:
+        print(f"\n{failed} plan check(s) failed")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--database", default=CHECK_DB)
+    sys.exit(asyncio.run(main(parser.parse_args())))
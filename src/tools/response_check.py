@@ -0,0 +1,123 @@
+"""Check that ModelResponse renders byte for byte what FastAPI's response_model would for every route using it.
+
+Run from src/:
+
+    python -m tools.response_check
+
+Nothing touches the database. Exits with status 1 on any difference, CI runs it on every push.
+"""
+import copy
+import sys
+from datetime import datetime, timedelta, timezone
+
+from bson import ObjectId
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import models
+from models.polls import PollWithResultsModel
+from responses import ModelResponse
+
+
+def sample_users() -> dict:
+    party = {"_id": ObjectId(), "name": "Partí Démocratique", "shorthand": "PD", "color": "blue"}
+    return {"users": [
+        {"_id": ObjectId(), "name": "Zoë", "dc_uuid": "100000000000000001", "mc_uuid": "a" * 32, "party": party,
+         "inactive": False, "activity_score": 12},
+        {"_id": ObjectId(), "name": "plain", "dc_uuid": "100000000000000002", "mc_uuid": "b" * 32, "party": None},
+    ], "next_cursor": "eyJ2IjogMX0"}
+
+
+def sample_legacy_polls() -> dict:
+    return {"polls": [{
+        "_id": ObjectId(), "title": "Act 12 – “quotes”", "proposal": 12, "total_voters": 40,
+        "choices": [{"body": "Yes", "votes": 21}, {"body": "No", "votes": 19}],
+        "voters": [], "closes": datetime.now(timezone.utc),
+    }]}
+
+
+def sample_election_results() -> dict:
+    winner = ObjectId()
+    return {
+        "winner": winner,
+        "total_ballots": 3,
+        "rounds": [{"counts": {str(winner): 2, str(ObjectId()): 1}, "eliminated": [str(ObjectId())]}],
+        "timestamp": datetime(2025, 5, 1, 12, 30, 15, 123456, tzinfo=timezone.utc),
+    }
+
+
+def sample_poll_results() -> dict:
+    yes, no, ticket = ObjectId(), ObjectId(), ObjectId()
+    now = datetime.now(timezone.utc)
+    return {
+        "_id": ObjectId(),
+        "title": "Star poll",
+        "choices": [
+            {"_id": yes, "text": "Yes"},
+            {"_id": no, "text": "No"},
+            {"_id": ticket, "candidate": {"user": ObjectId(), "name": "Lemon"}, "running_mate": None,
+             "campaign": {"party": ObjectId(), "name": "Citrus"}},
+        ],
+        "timestamp": now,
+        "open": False,
+        "ballot_type": "star",
+        "voter_filter": {"inactive": False, "party": ObjectId()},
+        "dynamic_voters": True,
+        "secret": True,
+        "schedule": {"opens": now - timedelta(days=2), "closes": now},
+        "results": {"public": True, "data": {
+            "results_type": "star",
+            "total_scores": {str(yes): 9, str(no): 4},
+            "highlighted_races": [[str(yes), str(no)]],
+            "preference_matrix": {str(yes): {str(no): {"win": 2, "lose": 1, "tie": 0}}},
+        }},
+    }
+
+
+# every route returning a ModelResponse, with the response_model it declares
+CASES = [
+    ("GET /users/", models.UserCollection, sample_users),
+    ("GET /users/batch", models.UserCollection, sample_users),
+    ("GET /legacy/polls/", models.PollCollection, sample_legacy_polls),
+    ("GET /legacy/polls/batch", models.PollCollection, sample_legacy_polls),
+    ("GET /elections/{election}/results", models.ElectionResultsModel, sample_election_results),
+    ("GET /polls/{poll_id}/results", PollWithResultsModel, sample_poll_results),
+]
+
+
+def render_both(response_type, content) -> tuple:
+    app = FastAPI()
+
+    @app.get("/response_model", response_model=response_type)
+    async def response_model_route():
+        return copy.deepcopy(content)
+
+    @app.get("/model_response", response_model=response_type)
+    async def model_response_route():
+        return ModelResponse(copy.deepcopy(content), response_type)
+
+    client = TestClient(app)
+    expected = client.get("/response_model")
+    actual = client.get("/model_response")
+    return expected, actual
+
+
+def main() -> int:
+    failures = 0
+    for route, response_type, sample in CASES:
+        expected, actual = render_both(response_type, sample())
+        same = expected.content == actual.content and \
+            expected.headers["content-type"] == actual.headers["content-type"]
+        print(f"{'ok' if same else 'DIFF':<5}{route}")
+        if not same:
+            failures += 1
+            print(f"     response_model: {expected.headers['content-type']} {expected.content[:300]!r}")
+            print(f"     ModelResponse:  {actual.headers['content-type']} {actual.content[:300]!r}")
+    if failures:
+        print(f"\n{failures} route(s) render differently through ModelResponse")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())